@@ -15,3 +15,6 @@ pipenv install --deploy --ignore-pipfile
 
 # Run database migrations
 flask db upgrade
+
+# Build the fingerprinted and precompressed static assets
+flask build-assets
@@ -0,0 +1,38 @@
+"""Cascade note deletes to favorites and deletions
+
+Revision ID: 49b23a13a5ca
+Revises: 5610cf41d97e
+Create Date: 2026-10-18 20:25:03.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '49b23a13a5ca'
+down_revision = '5610cf41d97e'
+branch_labels = None
+depends_on = None
+
+# The foreign keys were created without names. This matches the names that
+# Postgres gave them, and lets SQLite's batch mode find them.
+naming_convention = {
+    "fk": "%(table_name)s_%(column_0_name)s_fkey",
+}
+
+
+def _replace_note_foreign_keys(ondelete):
+    for table in ('FavoriteNotes', 'DeletedNotes'):
+        name = f'{table}_note_id_fkey'
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, 'Notes', ['note_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_note_foreign_keys(ondelete='CASCADE')
+
+
+def downgrade():
+    _replace_note_foreign_keys(ondelete=None)
@@ -12,8 +12,10 @@ from flask_wtf.csrf import CSRFProtect
 from werkzeug.exceptions import NotFound
 
 import backend
+import commands
 import views
 from config import get_config
+from utils import assets, compression, json_provider, timing
 from utils.auth import get_logged_in_user
 from utils.server import _render
 
@@ -28,12 +30,24 @@ APP_NAME = "Personal Notes"
 app = Flask(__name__, instance_relative_config=True)
 app.config.from_object(get_config(app.debug))
 
+# Set up the JSON provider
+json_provider.init_app(app)
+
 # Set up CSRF protection
 CSRFProtect().init_app(app)
 
 # Set up backend database
 backend.init_app(app)
 
+# Set up request timing (after the database, since it hooks the engine)
+timing.init_app(app)
+
+# Set up serving the built static assets
+assets.init_app(app)
+
+# Set up compressing responses (after timing, so that it's timed too)
+compression.init_app(app)
+
 # =============================================================================
 
 
@@ -101,3 +115,6 @@ def error_forbidden(e):
 
 # Register all views
 views.register_all(app)
+
+# Register all CLI commands
+commands.register_all(app)
@@ -5,23 +5,88 @@ Methods and objects pertaining to the backend database.
 # =============================================================================
 
 from flask_migrate import Migrate
+from sqlalchemy import event
 
-from backend import friend, models, note, user
+from backend import _bus, friend, models, note, stream, user
+from backend._utils import batch
 from backend.models import db
 
 # =============================================================================
 
 __all__ = (
     "db",
+    "batch",
     "models",
     "user",
     "friend",
     "note",
+    "stream",
 )
 
 # =============================================================================
 
 
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    # pylint: disable=unused-argument
+    # SQLite doesn't enforce foreign keys (or cascade deletes through them)
+    # unless asked to for each connection
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.close()
+    # pysqlite begins transactions on its own, which breaks savepoints (the
+    # outer transaction is committed when the first savepoint is released),
+    # so let SQLAlchemy begin them instead
+    dbapi_connection.isolation_level = None
+
+
+def _begin_sqlite_transaction(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
+def _configure_pool(app):
+    """Sizes the connection pool so that each request thread can get a
+    connection (see `REQUEST_THREADS` in `config.py`).
+    """
+    database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    if database_uri is None or database_uri.startswith("sqlite"):
+        return
+    request_threads = app.config["REQUEST_THREADS"]
+    pool_size = min(app.config["DB_POOL_SIZE"], request_threads)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": pool_size,
+        "max_overflow": request_threads - pool_size,
+        **app.config["SQLALCHEMY_ENGINE_OPTIONS"],
+    }
+
+
 def init_app(app):
+    _configure_pool(app)
     db.init_app(app)
     Migrate(app, db)
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _configure_sqlite_connection)
+        event.listen(engine, "begin", _begin_sqlite_transaction)
+
+    _bus.init_app(app)
+    stream.init_app(app)
+    friend.friends_cache.configure(
+        max_size=app.config["FRIENDS_CACHE_MAX_USERS"],
+        ttl=app.config["FRIENDS_CACHE_TTL_SECONDS"],
+        enabled=app.config["FRIENDS_CACHE_ENABLED"],
+    )
+    user.data_versions_cache.configure(
+        max_size=app.config["DATA_VERSIONS_CACHE_MAX_USERS"],
+        ttl=app.config["DATA_VERSIONS_CACHE_TTL_SECONDS"],
+        enabled=app.config["DATA_VERSIONS_CACHE_ENABLED"],
+    )
+
+
+def get_cache_stats():
+    """Returns the stats of each of this worker's caches."""
+    return {
+        "friends": friend.friends_cache.stats(),
+        "dataVersions": user.data_versions_cache.stats(),
+    }
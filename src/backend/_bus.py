@@ -0,0 +1,289 @@
+"""
+A bus for events about changed data, such as cache invalidations.
+
+Backend methods publish events about the data they change before
+committing. Once the transaction commits, the events are applied to this
+worker's caches (and streams) by the subscribed handlers, and are also
+sent to the other workers through Postgres `NOTIFY`. Each worker has a
+background thread that `LISTEN`s for them and applies them to its own
+caches.
+
+With any other database (such as SQLite), or if notifying is disabled in
+the config, events are only applied in this worker. This is only correct
+for a single worker process; otherwise the caches of the other workers
+stay stale until their entries expire.
+
+Each handler is called with a tuple of ids, or with None if everything
+should be invalidated (such as after the listener reconnects, since it
+could have missed events in the meantime).
+"""
+
+# =============================================================================
+
+import json
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import event, func
+from sqlalchemy import select as sql_select
+
+from backend.models import db
+
+# =============================================================================
+
+__all__ = (
+    "FRIENDSHIP_CHANGED",
+    "NOTES_CHANGED",
+    "USER_CHANGED",
+    "DATA_VERSIONS_CHANGED",
+    "NOTE_SENT",
+    "NOTE_UNSENT",
+    "FRIEND_REQUEST_SENT",
+    "subscribe",
+    "friendship_changed",
+    "notes_changed",
+    "user_changed",
+    "data_versions_changed",
+    "note_sent",
+    "note_unsent",
+    "friend_request_sent",
+    "init_app",
+)
+
+# =============================================================================
+
+FRIENDSHIP_CHANGED = "friendship_changed"
+NOTES_CHANGED = "notes_changed"
+USER_CHANGED = "user_changed"
+DATA_VERSIONS_CHANGED = "data_versions_changed"
+NOTE_SENT = "note_sent"
+NOTE_UNSENT = "note_unsent"
+FRIEND_REQUEST_SENT = "friend_request_sent"
+
+CHANNEL = "cache_invalidation"
+
+# Postgres limits payloads to 8000 bytes, so split up events with many ids
+MAX_IDS_PER_NOTIFY = 500
+
+# How long the listener waits for a notification before checking that its
+# connection is still alive
+LISTEN_POLL_SECONDS = 30
+# How long the listener waits before reconnecting after an error
+RECONNECT_SECONDS = 5
+
+# The key in `Session.info` of the events to apply after the commit
+_PENDING_KEY = "bus_pending_events"
+
+Handler = Callable[[Optional[Tuple[int, ...]]], None]
+
+# =============================================================================
+
+_handlers: Dict[str, List[Handler]] = {}
+
+# Whether to send events to the other workers
+_notify = False
+
+# The id of this worker, to ignore its own notifications, and the process
+# that its listener was started in (the app may be loaded before forking)
+_worker_id = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+# =============================================================================
+
+
+def subscribe(event_name: str, handler: Handler):
+    """Calls the given handler whenever the given event is committed by
+    any worker.
+    """
+    _handlers.setdefault(event_name, []).append(handler)
+
+
+def _dispatch(event_name: str, ids: Optional[Tuple[int, ...]]):
+    for handler in _handlers.get(event_name, ()):
+        handler(ids)
+
+
+def _reset_all():
+    """Invalidates everything, since events may have been missed."""
+    for event_name in _handlers:
+        _dispatch(event_name, None)
+
+
+def _publish(event_name: str, ids: Iterable[int]):
+    """Publishes an event as part of the current transaction."""
+    if event_name not in _handlers:
+        # Every worker runs the same code, so no one is interested
+        return
+    ids = tuple(sorted(set(ids)))
+    if len(ids) == 0:
+        return
+
+    db.session.info.setdefault(_PENDING_KEY, []).append((event_name, ids))
+
+    if _notify:
+        # Notifications are only delivered if the transaction commits
+        for i in range(0, len(ids), MAX_IDS_PER_NOTIFY):
+            payload = json.dumps(
+                {
+                    "worker": _worker_id,
+                    "event": event_name,
+                    "ids": ids[i : i + MAX_IDS_PER_NOTIFY],
+                }
+            )
+            db.session.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+
+
+def friendship_changed(*user_ids: int):
+    """Publishes that the friendships of the given users changed."""
+    _publish(FRIENDSHIP_CHANGED, user_ids)
+
+
+def notes_changed(*user_ids: int):
+    """Publishes that the notes (or drafts) that the given users see
+    changed.
+    """
+    _publish(NOTES_CHANGED, user_ids)
+
+
+def user_changed(*user_ids: int):
+    """Publishes that the profiles of the given users changed."""
+    _publish(USER_CHANGED, user_ids)
+
+
+def data_versions_changed(*user_ids: int):
+    """Publishes that the data versions of the given users changed."""
+    _publish(DATA_VERSIONS_CHANGED, user_ids)
+
+
+def note_sent(*recipient_ids: int):
+    """Publishes that the given users were sent a note."""
+    _publish(NOTE_SENT, recipient_ids)
+
+
+def note_unsent(*recipient_ids: int):
+    """Publishes that a note sent to the given users was unsent."""
+    _publish(NOTE_UNSENT, recipient_ids)
+
+
+def friend_request_sent(*recipient_ids: int):
+    """Publishes that the given users were sent a friend request."""
+    _publish(FRIEND_REQUEST_SENT, recipient_ids)
+
+
+# =============================================================================
+
+
+def _after_commit(session):
+    for event_name, ids in session.info.pop(_PENDING_KEY, ()):
+        _dispatch(event_name, ids)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        # Only a savepoint was rolled back. Its events are still applied,
+        # which is harmless since they only invalidate or notify.
+        return
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _receive(payload: str):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get("worker") == _worker_id:
+        # Already applied when this worker committed
+        return
+    _dispatch(message.get("event"), tuple(message.get("ids", ())))
+
+
+def _listen(engine, logger):
+    """Listens for notifications from the other workers forever."""
+    dialect = engine.dialect
+    connect_args, connect_kwargs = dialect.create_connect_args(engine.url)
+    while True:
+        connection = None
+        try:
+            # Use a dedicated connection so that the pool isn't affected
+            connection = dialect.connect(*connect_args, **connect_kwargs)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            # Anything could have changed while not listening
+            _reset_all()
+            while True:
+                readable, _, _ = select.select(
+                    [connection], [], [], LISTEN_POLL_SECONDS
+                )
+                if not readable:
+                    # Check that the connection is still alive
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    _receive(connection.notifies.pop(0).payload)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Cache invalidation listener failed")
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    pass
+        time.sleep(RECONNECT_SECONDS)
+
+
+def _ensure_listening(app):
+    """Starts the listener thread for this worker process, if it hasn't
+    been started yet.
+    """
+    global _worker_id, _listener_pid  # pylint: disable=global-statement
+
+    pid = os.getpid()
+    if _listener_pid == pid:
+        return
+    with _listener_lock:
+        if _listener_pid == pid:
+            return
+        _worker_id = f"{pid}-{uuid4().hex}"
+        # This worker may have been forked with stale caches
+        _reset_all()
+        threading.Thread(
+            target=_listen,
+            args=(db.engine, app.logger),
+            name="cache-invalidation-listener",
+            daemon=True,
+        ).start()
+        _listener_pid = pid
+
+
+def init_app(app):
+    """Sets up the bus for the app.
+
+    Must be called after the database is set up.
+    """
+    global _notify  # pylint: disable=global-statement
+
+    event.listen(db.session, "after_commit", _after_commit)
+    event.listen(db.session, "after_soft_rollback", _after_soft_rollback)
+
+    with app.app_context():
+        dialect_name = db.engine.dialect.name
+    _notify = (
+        app.config["INVALIDATION_BUS_NOTIFY"] and dialect_name == "postgresql"
+    )
+    if _notify:
+        # Started lazily so that CLI commands don't listen, and so that
+        # each forked worker gets its own listener
+        app.before_request(lambda: _ensure_listening(app))
+    elif app.config["INVALIDATION_BUS_NOTIFY"]:
+        app.logger.info(
+            "Cache invalidations are only applied within each worker, "
+            "since the database is not Postgres"
+        )
@@ -0,0 +1,155 @@
+"""
+An in-process cache for backend lookups.
+
+Each worker has its own caches, so they are only as fresh as their
+invalidation: backend methods that change cached data must invalidate
+the affected keys after committing.
+
+A value that is loaded while its key is invalidated may already be stale,
+so lookups that fill the cache get a token from `fill_token()` before
+loading, and the value is only stored if the key wasn't invalidated since.
+"""
+
+# =============================================================================
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, Hashable, Optional
+
+# =============================================================================
+
+__all__ = ("LRUCache",)
+
+# =============================================================================
+
+# How many recent invalidations are remembered for `fill_token()`. Fills
+# that started before the oldest remembered one are not stored.
+MAX_TRACKED_INVALIDATIONS = 1024
+
+# =============================================================================
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache, with an optional time to
+    live for each entry.
+
+    When the cache is disabled, every lookup is a miss and nothing is
+    stored.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = None,
+        enabled: bool = True,
+    ):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # Incremented on every invalidation
+        self._generation = 0
+        # The generation that each recently invalidated key was invalidated
+        # in, oldest first
+        self._invalidated = OrderedDict()
+        # Fills that started before this generation may be stale
+        self._stale_before = 0
+
+    def configure(self, max_size: int, ttl: Optional[float], enabled: bool):
+        """Updates the settings of this cache, and clears it."""
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self.enabled = enabled
+            self._clear()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the value cached for the given key, or None if there is
+        no (fresh) value.
+        """
+        with self._lock:
+            if not self.enabled:
+                self.misses += 1
+                return None
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def fill_token(self) -> int:
+        """Returns a token to pass to `set()` for a value that is about to
+        be loaded.
+        """
+        with self._lock:
+            return self._generation
+
+    def _is_stale(self, key: Hashable, token: int) -> bool:
+        if token < self._stale_before:
+            return True
+        return self._invalidated.get(key, -1) >= token
+
+    def set(self, key: Hashable, value: Any, token: Optional[int] = None):
+        """Caches the given value, evicting the least recently used entry
+        if the cache is full.
+
+        If a token from `fill_token()` is given, the value isn't cached if
+        the key was invalidated since the token was taken.
+        """
+        with self._lock:
+            if not self.enabled:
+                return
+            if token is not None and self._is_stale(key, token):
+                return
+            expires_at = None
+            if self.ttl is not None:
+                expires_at = monotonic() + self.ttl
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        """Removes the given keys from the cache."""
+        with self._lock:
+            generation = self._generation
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._invalidated[key] = generation
+                self._invalidated.move_to_end(key)
+            while len(self._invalidated) > MAX_TRACKED_INVALIDATIONS:
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._stale_before = max(self._stale_before, forgotten + 1)
+
+    def _clear(self):
+        self._entries.clear()
+        self._invalidated.clear()
+        self._generation += 1
+        self._stale_before = self._generation
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict:
+        """Returns the settings and counters of this cache."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "ttlSeconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
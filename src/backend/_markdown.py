@@ -0,0 +1,91 @@
+"""
+Renders the Markdown text of notes as sanitized HTML.
+
+This mirrors `parseMarkdown()` in `static/global.js`, which is still used
+for drafts (since they change as they are edited).
+"""
+
+# =============================================================================
+
+import re
+from typing import Optional
+
+import nh3
+from emoji_data_python import EmojiChar, emoji_short_names
+from markdown_it import MarkdownIt
+
+# =============================================================================
+
+__all__ = (
+    "RENDERER_VERSION",
+    "render_markdown",
+)
+
+# =============================================================================
+
+# Increment whenever the rendered HTML would change, so that the HTML stored
+# for existing notes is re-rendered (see `flask render-notes`)
+RENDERER_VERSION = 2
+
+# Common zero-width characters that some keyboards insert at the start
+ZERO_WIDTH_PREFIX = re.compile("^[\u200B\u200C\u200D\u200E\u200F\uFEFF]")
+
+# Emoji shortcodes, optionally followed by a skin tone (like `js-emoji`)
+EMOJI_SHORTCODE_PATTERN = re.compile(
+    r":([a-zA-Z0-9_+-]+):(?::(skin-tone-[2-6]):)?"
+)
+
+# Like `marked` with its default options: CommonMark with raw HTML (which is
+# sanitized afterwards), plus tables, strikethrough, and autolinked urls
+# from GFM
+_md = MarkdownIt("commonmark", {"html": True, "linkify": True}).enable(
+    ["table", "strikethrough", "linkify"]
+)
+
+# =============================================================================
+
+
+def _find_emoji(shortcode: str) -> Optional[EmojiChar]:
+    """Returns the emoji with the given shortcode, or None if there isn't
+    one. Underscores and hyphens are interchangeable (like `initEmoji()`
+    in `static/global.js`).
+    """
+    for code in (
+        shortcode,
+        shortcode.replace("-", "_"),
+        shortcode.replace("_", "-"),
+    ):
+        emoji = emoji_short_names.get(code, None)
+        if emoji is not None:
+            return emoji
+    return None
+
+
+def _replace_emoji(match: re.Match) -> str:
+    shortcode, skin_tone = match.groups()
+    emoji = _find_emoji(shortcode)
+    if emoji is None:
+        return match.group(0)
+    if skin_tone is None:
+        return emoji.char
+    skin_tone = emoji_short_names[skin_tone]
+    with_skin_tone = emoji.skin_variations.get(skin_tone.unified, None)
+    if with_skin_tone is None:
+        return emoji.char + skin_tone.char
+    return with_skin_tone.char
+
+
+def _emojize(text: str) -> str:
+    """Converts the emoji shortcodes in the given text, using the same
+    data as `js-emoji` (from `iamcal/emoji-data`).
+    """
+    return EMOJI_SHORTCODE_PATTERN.sub(_replace_emoji, text)
+
+
+def render_markdown(text: str) -> str:
+    """Converts emoji shortcodes in the given text, then renders it as
+    Markdown and returns the sanitized HTML.
+    """
+    text = ZERO_WIDTH_PREFIX.sub("", text)
+    text = _emojize(text)
+    return nh3.clean(_md.render(text))
@@ -4,17 +4,39 @@ Backend utilities.
 
 # =============================================================================
 
-from backend.models import db
+from contextlib import contextmanager
+from typing import List, Sequence
+
+from sqlalchemy import Row, and_, exists, insert, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from backend.models import User, db
 
 # =============================================================================
 
 __all__ = (
     "query",
     "_exists",
+    "load_users",
+    "insert_or_ignore",
+    "commit",
+    "rollback",
+    "batch",
 )
 
 # =============================================================================
 
+# The key in `Session.info` that is set while running a batch
+_BATCH_KEY = "in_batch"
+
+# How many times `insert_or_ignore()` tries to insert rows on databases
+# without `ON CONFLICT`, when concurrent transactions insert them first
+MAX_INSERT_ATTEMPTS = 3
+
+# =============================================================================
+
 
 def query(model, filter_condition):
     return db.session.scalars(db.select(model).filter(filter_condition))
@@ -23,3 +45,142 @@ def query(model, filter_condition):
 def _exists(model, filter_condition) -> bool:
     """Returns whether a row exists that matches the given condition."""
     return query(model, filter_condition).first() is not None
+
+
+def load_users(objects: Sequence[db.Model], *relationships: str):
+    """Loads the users for the given relationships of all the objects
+    in a single query, so that accessing the relationships later does
+    not lazy load each user with a separate query.
+
+    All the objects must be of the same model.
+    """
+    if len(objects) == 0:
+        return
+    mapper = inspect(type(objects[0]))
+    # Map each relationship to the attribute holding its foreign key
+    foreign_keys = {}
+    for relationship in relationships:
+        (column,) = mapper.relationships[relationship].local_columns
+        foreign_keys[relationship] = mapper.get_property_by_column(column).key
+
+    user_ids = set()
+    for obj in objects:
+        for key in foreign_keys.values():
+            user_ids.add(getattr(obj, key))
+    user_ids.discard(None)
+    users = {user.id: user for user in query(User, User.id.in_(user_ids))}
+
+    for obj in objects:
+        for relationship, key in foreign_keys.items():
+            set_committed_value(
+                obj, relationship, users.get(getattr(obj, key))
+            )
+
+
+def _insert_missing(model, columns: List[str], rows) -> List[Row]:
+    """Inserts the selected rows that don't exist yet, and returns them.
+
+    The rows are selected and inserted in a savepoint, which is retried if
+    a concurrent transaction inserts one of them in the meantime.
+    """
+    selected = rows.subquery()
+    selected_columns = dict(zip(columns, selected.c))
+    primary_key = inspect(model).primary_key
+    missing = select(*selected.c).where(
+        ~exists().where(
+            and_(
+                *(
+                    column == selected_columns[column.key]
+                    for column in primary_key
+                )
+            )
+        )
+    )
+    attempts = 1
+    while True:
+        try:
+            with db.session.begin_nested():
+                inserted = db.session.execute(missing).all()
+                if len(inserted) > 0:
+                    db.session.execute(
+                        insert(model),
+                        [dict(zip(columns, row)) for row in inserted],
+                    )
+            return inserted
+        except IntegrityError:
+            if attempts >= MAX_INSERT_ATTEMPTS:
+                raise
+            attempts += 1
+
+
+def insert_or_ignore(model, columns: List[str], rows, returning) -> List:
+    """Inserts the rows selected by the given statement (with the given
+    columns) into the table of the given model, skipping rows whose
+    primary key already exists, and returns the values of the `returning`
+    column of the inserted rows.
+
+    On Postgres and SQLite, this is a single atomic statement (`ON CONFLICT
+    DO NOTHING`), so inserting a row that may already exist can't conflict
+    with concurrent requests.
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(model)
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(model)
+    else:
+        inserted = _insert_missing(model, columns, rows)
+        index = columns.index(returning.key)
+        return [row[index] for row in inserted]
+    return db.session.scalars(
+        stmt.on_conflict_do_nothing()
+        .from_select(columns, rows)
+        .returning(returning)
+    ).all()
+
+
+# =============================================================================
+
+
+def commit():
+    """Commits the current transaction, unless running in a batch (see
+    `batch()`), in which case the changes are only flushed.
+
+    Backend methods should always commit through this.
+    """
+    if db.session.info.get(_BATCH_KEY, False):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+def rollback():
+    """Rolls back the current transaction, unless running in a batch, in
+    which case the savepoint of the operation is rolled back once the
+    error propagates to it.
+    """
+    if not db.session.info.get(_BATCH_KEY, False):
+        db.session.rollback()
+
+
+@contextmanager
+def batch():
+    """Runs backend methods in a single transaction, which is committed
+    at the end (or rolled back if an error is raised).
+
+    Yields a function that starts a savepoint, to be used as a context
+    manager around each operation. A savepoint is rolled back if an error
+    is raised in it, or if it is rolled back explicitly, so that the
+    other operations are still committed.
+    """
+    if db.session.info.get(_BATCH_KEY, False):
+        raise RuntimeError("Batches can't be nested")
+    db.session.info[_BATCH_KEY] = True
+    try:
+        yield db.session.begin_nested
+    except BaseException:
+        db.session.info.pop(_BATCH_KEY, None)
+        db.session.rollback()
+        raise
+    db.session.info.pop(_BATCH_KEY, None)
+    db.session.commit()
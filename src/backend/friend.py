@@ -4,57 +4,152 @@ Helper methods for friendships, friend requests, and friend nicknames.
 
 # =============================================================================
 
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
 
-from sqlalchemy import and_, or_, select
+from sqlalchemy import and_, delete, or_, select, union, union_all
 
-from backend._utils import query
+import backend
+from backend import _bus as bus
+from backend._cache import LRUCache
+from backend._utils import commit, load_users, query
 from backend.models import FriendNickname, FriendRequest, Friendship, User, db
 
 # =============================================================================
 
+# The maximum number of friends that can be requested at once
+MAX_PAGE_SIZE = 200
 
-def get_all(user_id: int) -> List[User]:
-    """Returns the requested user's friends.
+# The ids of each user's friends, by user id. Configured from the app config
+# in `backend.init_app()`.
+friends_cache = LRUCache()
 
-    The users will be sorted by username alphabetically.
+
+def _invalidate_friends_cache(user_ids: Optional[Tuple[int, ...]]):
+    if user_ids is None:
+        friends_cache.clear()
+    else:
+        friends_cache.invalidate(*user_ids)
+
+
+bus.subscribe(bus.FRIENDSHIP_CHANGED, _invalidate_friends_cache)
+
+# =============================================================================
+
+
+class Friend(NamedTuple):
+    """A user's friend, along with the nickname the user has given them
+    (if any).
+    """
+
+    id: int
+    username: str
+    display_name: str
+    nickname: Optional[str]
+
+    def to_json(self) -> Dict:
+        """Returns a JSON representation of this friend."""
+        json = {
+            "id": self.id,
+            "username": self.username,
+            "displayName": self.display_name,
+        }
+        if self.nickname:
+            json["nickname"] = self.nickname
+        return json
+
+
+def get_all(
+    user_id: int,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+) -> Tuple[List[Friend], Optional[str]]:
+    """Returns the requested user's friends, optionally only the ones
+    whose usernames start with the given prefix.
+
+    The friends will be sorted by username alphabetically, starting
+    after the `after` username if given. If a limit is given, also
+    returns the cursor (a username) for the next page, or None if there
+    are no more friends.
     """
-    # Split into two queries because otherwise `User` instances will not
-    # be returned
-    users_with_nicknames = (
-        db.session.execute(
-            select(User, FriendNickname.nickname)
-            .select_from(Friendship)
-            .join(User, User.id == Friendship.user2_id)
-            .outerjoin(
-                FriendNickname,
-                and_(
-                    FriendNickname.user_id == user_id,
-                    FriendNickname.friend_id == User.id,
-                ),
-            )
-            .where(Friendship.user1_id == user_id)
-        ).all()
-        + db.session.execute(
-            select(User, FriendNickname.nickname)
-            .select_from(Friendship)
-            .join(User, User.id == Friendship.user1_id)
-            .outerjoin(
-                FriendNickname,
-                and_(
-                    FriendNickname.user_id == user_id,
-                    FriendNickname.friend_id == User.id,
-                ),
-            )
-            .where(Friendship.user2_id == user_id)
-        ).all()
+    friend_ids = _get_cached_friend_ids(user_id)
+    if friend_ids is None:
+        # The cache is disabled, so look up the friends in the same query
+        friend_ids_filter = User.id.in_(_select_friend_ids(user_id))
+    elif len(friend_ids) == 0:
+        return [], None
+    else:
+        friend_ids_filter = User.id.in_(friend_ids)
+    stmt = (
+        select(
+            User.id, User.username, User.display_name, FriendNickname.nickname
+        )
+        .outerjoin(
+            FriendNickname,
+            and_(
+                FriendNickname.user_id == user_id,
+                FriendNickname.friend_id == User.id,
+            ),
+        )
+        .where(friend_ids_filter)
+        .order_by(User.username)
     )
-    users = []
-    for user, nickname in users_with_nicknames:
-        if nickname:
-            user.set_nickname(nickname)
-        users.append(user)
-    return sorted(users, key=lambda u: u.username)
+    if prefix:
+        stmt = stmt.where(User.username.startswith(prefix, autoescape=True))
+    if after is not None:
+        stmt = stmt.where(User.username > after)
+    if limit is not None:
+        # Fetch one extra to tell if there is a next page
+        stmt = stmt.limit(limit + 1)
+
+    friends = [Friend(*row) for row in db.session.execute(stmt)]
+    if limit is None or len(friends) <= limit:
+        return friends, None
+    friends = friends[:limit]
+    return friends, friends[-1].username
+
+
+def _select_friend_ids(user_id: int):
+    # Friendships are stored with the lower ID first, so the user could be
+    # on either side
+    return union_all(
+        select(Friendship.user2_id).where(Friendship.user1_id == user_id),
+        select(Friendship.user1_id).where(Friendship.user2_id == user_id),
+    )
+
+
+def get_related_user_ids(user_id: int) -> List[int]:
+    """Returns the ids of the users whose lists include the given user:
+    their friends, and the users they have pending friend requests with.
+    """
+    return db.session.scalars(
+        union(
+            select(Friendship.user2_id).where(Friendship.user1_id == user_id),
+            select(Friendship.user1_id).where(Friendship.user2_id == user_id),
+            select(FriendRequest.recipient_id).where(
+                FriendRequest.sender_id == user_id
+            ),
+            select(FriendRequest.sender_id).where(
+                FriendRequest.recipient_id == user_id
+            ),
+        )
+    ).all()
+
+
+def _get_cached_friend_ids(user_id: int) -> Optional[FrozenSet[int]]:
+    """Returns the ids of the user's friends through the cache, or None
+    if the cache is disabled.
+    """
+    if not friends_cache.enabled:
+        return None
+    friend_ids = friends_cache.get(user_id)
+    if friend_ids is None:
+        token = friends_cache.fill_token()
+        friend_ids = frozenset(
+            db.session.scalars(_select_friend_ids(user_id)).all()
+        )
+        friends_cache.set(user_id, friend_ids, token)
+    return friend_ids
 
 
 def _get_friendship(user1_id: int, user2_id: int) -> Optional[Friendship]:
@@ -66,12 +161,30 @@ def _get_friendship(user1_id: int, user2_id: int) -> Optional[Friendship]:
     ).one_or_none()
 
 
+def friendship_exists(user1_id: int, user2_id: int):
+    """Returns an `EXISTS` clause of whether the two given users are
+    friends, to check as part of another statement.
+    """
+    if user1_id > user2_id:
+        user1_id, user2_id = user2_id, user1_id
+    return (
+        select(Friendship.user1_id)
+        .where(
+            Friendship.user1_id == user1_id, Friendship.user2_id == user2_id
+        )
+        .exists()
+    )
+
+
 def are_friends(user1_id: int, user2_id: int) -> bool:
     """Returns whether the two given users are friends."""
     if user1_id == user2_id:
         # Can't be friends with yourself
         return False
 
+    friend_ids = _get_cached_friend_ids(user1_id)
+    if friend_ids is not None:
+        return user2_id in friend_ids
     return _get_friendship(user1_id, user2_id) is not None
 
 
@@ -85,20 +198,25 @@ def remove(user1_id: int, user2_id: int):
         raise ValueError("Users are not friends")
 
     db.session.delete(friendship)
-    db.session.commit()
+    backend.user.bump_data_versions(user1_id, user2_id)
+    bus.friendship_changed(user1_id, user2_id)
+    commit()
 
 
 def remove_all(user_id: int):
     """Removes all the friendships the given user has."""
-    friendships = query(
-        Friendship,
-        or_(Friendship.user1_id == user_id, Friendship.user2_id == user_id),
+    # The friend's id is whichever side of the friendship isn't the user
+    friend_ids = db.session.scalars(
+        delete(Friendship)
+        .where(
+            or_(Friendship.user1_id == user_id, Friendship.user2_id == user_id)
+        )
+        .returning(Friendship.user1_id + Friendship.user2_id - user_id)
+        .execution_options(synchronize_session=False)
     ).all()
-    if len(friendships) == 0:
-        return
-    for friendship in friendships:
-        db.session.delete(friendship)
-    db.session.commit()
+    backend.user.bump_data_versions(user_id, *friend_ids)
+    bus.friendship_changed(user_id, *friend_ids)
+    commit()
 
 
 # =============================================================================
@@ -109,13 +227,12 @@ def get_outgoing_friend_requests(user_id: int) -> List[User]:
 
     The users will be sorted by username alphabetically.
     """
+    friend_requests = query(
+        FriendRequest, FriendRequest.sender_id == user_id
+    ).all()
+    load_users(friend_requests, "recipient")
     return sorted(
-        (
-            request.recipient
-            for request in query(
-                FriendRequest, FriendRequest.sender_id == user_id
-            ).all()
-        ),
+        (request.recipient for request in friend_requests),
         key=lambda u: u.username,
     )
 
@@ -125,13 +242,12 @@ def get_incoming_friend_requests(user_id: int) -> List[User]:
 
     The users will be sorted by username alphabetically.
     """
+    friend_requests = query(
+        FriendRequest, FriendRequest.recipient_id == user_id
+    ).all()
+    load_users(friend_requests, "sender")
     return sorted(
-        (
-            request.sender
-            for request in query(
-                FriendRequest, FriendRequest.recipient_id == user_id
-            ).all()
-        ),
+        (request.sender for request in friend_requests),
         key=lambda u: u.username,
     )
 
@@ -166,7 +282,9 @@ def send_request(sender_id: int, recipient_id: int):
         raise ValueError("Friend request has already been sent")
 
     db.session.add(FriendRequest(sender_id, recipient_id))
-    db.session.commit()
+    backend.user.bump_data_versions(sender_id, recipient_id)
+    bus.friend_request_sent(recipient_id)
+    commit()
 
 
 def cancel_request(sender_id: int, recipient_id: int):
@@ -176,7 +294,8 @@ def cancel_request(sender_id: int, recipient_id: int):
         raise ValueError("Friend request does not exist")
 
     db.session.delete(friend_request)
-    db.session.commit()
+    backend.user.bump_data_versions(sender_id, recipient_id)
+    commit()
 
 
 def reject_request(recipient_id: int, sender_id: int):
@@ -186,7 +305,8 @@ def reject_request(recipient_id: int, sender_id: int):
         raise ValueError("Friend request does not exist")
 
     db.session.delete(friend_request)
-    db.session.commit()
+    backend.user.bump_data_versions(sender_id, recipient_id)
+    commit()
 
 
 def accept_request(sender_id: int, recipient_id: int):
@@ -201,7 +321,9 @@ def accept_request(sender_id: int, recipient_id: int):
 
     db.session.add(Friendship(sender_id, recipient_id))
     db.session.delete(friend_request)
-    db.session.commit()
+    backend.user.bump_data_versions(sender_id, recipient_id)
+    bus.friendship_changed(sender_id, recipient_id)
+    commit()
 
 
 # =============================================================================
@@ -244,4 +366,5 @@ def set_nickname(user_id: int, friend_id: int, nickname: str):
     else:
         nickname_obj.set_nickname(nickname)
 
-    db.session.commit()
+    backend.user.bump_data_versions(user_id)
+    commit()
@@ -6,10 +6,20 @@ The database and models.
 
 import re
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+)
+
+from backend._markdown import RENDERER_VERSION, render_markdown
 
 # =============================================================================
 
@@ -35,6 +45,11 @@ class User(db.Model):
     display_name = Column(String(100), nullable=False)
     is_admin = Column(Boolean(), nullable=False, default=False)
     is_deleted = Column(Boolean(), nullable=False, default=False)
+    # Incremented whenever any of the data that this user can see changes
+    # (see `backend.user.bump_data_versions()`)
+    data_version = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
     def __init__(
         self,
@@ -48,8 +63,6 @@ class User(db.Model):
         self.set_display_name(display_name)
         self.is_deleted = is_deleted
 
-        self._nickname = None
-
     def set_username(self, username: str):
         if not 3 <= len(username) <= 30:
             raise ValueError("Username must be between 3 and 30 characters")
@@ -67,23 +80,36 @@ class User(db.Model):
             )
         self.display_name = display_name
 
-    def set_nickname(self, nickname: str):
-        """Saves this user's nickname to use in other queries. Does not
-        make any database changes.
-        """
-        self._nickname = nickname
-
     def to_json(self) -> Dict:
         """Returns a JSON representation of this user."""
-        json = {
+        return {
             "id": self.id,
             "username": self.username,
             "displayName": self.display_name,
         }
-        nickname = getattr(self, "_nickname", None)
-        if nickname:
-            json["nickname"] = nickname
-        return json
+
+    @staticmethod
+    def to_json_cached(
+        user_id: int,
+        obj: db.Model,
+        relationship: str,
+        users_json: Optional[Dict[int, Dict]],
+    ) -> Dict:
+        """Returns a JSON representation of the user with the given id,
+        which is the given relationship of the given object.
+
+        If `users_json` is given, the representation is reused from it (and
+        added to it), so that when serializing a list of objects, each user
+        is only serialized once no matter how many objects refer to them.
+        The representations must therefore not be modified.
+        """
+        if users_json is None:
+            return getattr(obj, relationship).to_json()
+        user_json = users_json.get(user_id, None)
+        if user_json is None:
+            user_json = getattr(obj, relationship).to_json()
+            users_json[user_id] = user_json
+        return user_json
 
 
 class Friendship(db.Model):
@@ -97,6 +123,11 @@ class Friendship(db.Model):
     user1 = db.relationship("User", foreign_keys=[user1_id])
     user2 = db.relationship("User", foreign_keys=[user2_id])
 
+    # The primary key covers lookups by `user1_id`
+    __table_args__ = (
+        Index("ix_Friendships_user2_id_user1_id", user2_id, user1_id),
+    )
+
     def __init__(self, user1_id: int, user2_id: int):
         if user1_id == user2_id:
             raise ValueError("Cannot be friends with yourself")
@@ -121,6 +152,15 @@ class FriendRequest(db.Model):
     sender = db.relationship("User", foreign_keys=[sender_id])
     recipient = db.relationship("User", foreign_keys=[recipient_id])
 
+    # The primary key covers lookups by `sender_id`
+    __table_args__ = (
+        Index(
+            "ix_FriendRequests_recipient_id_sender_id",
+            recipient_id,
+            sender_id,
+        ),
+    )
+
     def __init__(self, sender_id: int, recipient_id: int):
         if sender_id == recipient_id:
             raise ValueError("Cannot be friends with yourself")
@@ -167,10 +207,18 @@ class DraftNote(db.Model):
     # Nullable, since a draft doesn't need a recipient yet
     recipient_id = Column(Integer, ForeignKey(User.id))
     text = Column(String(MAX_NOTE_LENGTH), nullable=False, default="")
+    # Incremented whenever the draft is updated, so that edits made against
+    # an older version (such as from another tab) are rejected
+    version = Column(Integer, nullable=False, server_default="0")
 
     user = db.relationship("User", foreign_keys=[user_id])
     recipient = db.relationship("User", foreign_keys=[recipient_id])
 
+    __table_args__ = (Index("ix_DraftNotes_user_id", user_id),)
+    # Every update checks and increments the version (raising a
+    # `StaleDataError` if it changed since the draft was loaded)
+    __mapper_args__ = {"version_id_col": version}
+
     def __init__(
         self, user_id: int, recipient_id: Optional[int] = None, text: str = ""
     ):
@@ -189,19 +237,37 @@ class DraftNote(db.Model):
             raise ValueError("Max note length exceeded")
         self.text = text
 
-    def to_json(self) -> Dict:
-        """Returns a JSON representation of this draft note."""
+    def to_json(self, users_json: Optional[Dict[int, Dict]] = None) -> Dict:
+        """Returns a JSON representation of this draft note.
+
+        See `User.to_json_cached()` for `users_json`.
+        """
         json = {
             "id": self.id,
-            "user": self.user.to_json(),
+            "user": User.to_json_cached(
+                self.user_id, self, "user", users_json
+            ),
         }
         if self.recipient_id is None:
             json["recipient"] = None
         else:
-            json["recipient"] = self.recipient.to_json()
+            json["recipient"] = User.to_json_cached(
+                self.recipient_id, self, "recipient", users_json
+            )
         json["text"] = self.text
+        json["version"] = self.version
         return json
 
+    @staticmethod
+    def list_to_json(drafts: Sequence["DraftNote"]) -> List[Dict]:
+        """Returns the JSON representations of the given drafts, which
+        share the representation of each user.
+
+        Each draft still gets its own dict; see `Note.list_to_json()`.
+        """
+        users_json = {}
+        return [draft.to_json(users_json) for draft in drafts]
+
     def is_ready_to_send(self) -> bool:
         try:
             Note(-1, self.recipient_id, self.text)
@@ -220,10 +286,31 @@ class Note(db.Model):
     recipient_id = Column(Integer, ForeignKey(User.id), nullable=False)
     text = Column(String(MAX_NOTE_LENGTH), nullable=False, default="")
     time_sent = Column(DateTime(timezone=False), nullable=False)
+    # The text rendered as HTML, and the version of the renderer that
+    # rendered it (since notes can't be edited, this only changes when the
+    # renderer does)
+    html = Column(String(), nullable=True)
+    html_version = Column(Integer, nullable=True)
 
     sender = db.relationship("User", foreign_keys=[sender_id])
     recipient = db.relationship("User", foreign_keys=[recipient_id])
 
+    # Match the ordering and pagination of `backend.note.get_all()`
+    __table_args__ = (
+        Index(
+            "ix_Notes_sender_id_time_sent",
+            sender_id,
+            time_sent.desc(),
+            id.desc(),
+        ),
+        Index(
+            "ix_Notes_recipient_id_time_sent",
+            recipient_id,
+            time_sent.desc(),
+            id.desc(),
+        ),
+    )
+
     def __init__(self, sender_id: int, recipient_id: int, text: str):
         if sender_id == recipient_id:
             raise ValueError("Cannot send note to yourself")
@@ -242,6 +329,21 @@ class Note(db.Model):
             raise ValueError("Note text cannot be all whitespace")
         self.text = text
 
+    def render_html(self):
+        """Renders the text of this note as HTML and stores it."""
+        self.html = render_markdown(self.text)
+        self.html_version = RENDERER_VERSION
+
+    def get_html(self) -> str:
+        """Returns the text of this note rendered as HTML.
+
+        If the stored HTML was rendered by an old version of the renderer
+        (or was never rendered), renders it again without storing it.
+        """
+        if self.html is None or self.html_version != RENDERER_VERSION:
+            return render_markdown(self.text)
+        return self.html
+
     def set_deleted(self, is_deleted: bool):
         """Saves whether the current user has deleted this note. Does
         not make any database changes.
@@ -268,12 +370,19 @@ class Note(db.Model):
         """
         return getattr(self, "_is_favorite", False)
 
-    def to_json(self) -> Dict:
-        """Returns a JSON representation of this draft note."""
+    def to_json(self, users_json: Optional[Dict[int, Dict]] = None) -> Dict:
+        """Returns a JSON representation of this note.
+
+        See `User.to_json_cached()` for `users_json`.
+        """
         json = {
             "id": self.id,
-            "sender": self.sender.to_json(),
-            "recipient": self.recipient.to_json(),
+            "sender": User.to_json_cached(
+                self.sender_id, self, "sender", users_json
+            ),
+            "recipient": User.to_json_cached(
+                self.recipient_id, self, "recipient", users_json
+            ),
             "text": self.text,
             "timeSent": self.time_sent.isoformat(),
         }
@@ -283,6 +392,19 @@ class Note(db.Model):
             json["is_favorite"] = self.is_favorite()
         return json
 
+    @staticmethod
+    def list_to_json(notes: Sequence["Note"]) -> List[Dict]:
+        """Returns the JSON representations of the given notes, which
+        share the representation of each user.
+
+        Each note still gets its own dict: building a dataclass per note
+        (which `orjson` can serialize directly) was measured to be slower
+        than building the dict, and most of the time goes to reading the
+        attributes of the loaded notes anyway.
+        """
+        users_json = {}
+        return [note.to_json(users_json) for note in notes]
+
 
 class FavoriteNote(db.Model):
     """A note that a user has marked as favorite."""
@@ -290,11 +412,16 @@ class FavoriteNote(db.Model):
     __tablename__ = "FavoriteNotes"
 
     user_id = Column(Integer, ForeignKey(User.id), primary_key=True)
-    note_id = Column(Integer, ForeignKey(Note.id), primary_key=True)
+    note_id = Column(
+        Integer, ForeignKey(Note.id, ondelete="CASCADE"), primary_key=True
+    )
 
     user = db.relationship("User")
     note = db.relationship("Note")
 
+    # The primary key covers lookups by `user_id`
+    __table_args__ = (Index("ix_FavoriteNotes_note_id", note_id),)
+
     def __init__(self, user_id: int, note_id: int):
         self.user_id = user_id
         self.note_id = note_id
@@ -306,11 +433,49 @@ class DeletedNote(db.Model):
     __tablename__ = "DeletedNotes"
 
     user_id = Column(Integer, ForeignKey(User.id), primary_key=True)
-    note_id = Column(Integer, ForeignKey(Note.id), primary_key=True)
+    note_id = Column(
+        Integer, ForeignKey(Note.id, ondelete="CASCADE"), primary_key=True
+    )
 
     user = db.relationship("User")
     note = db.relationship("Note")
 
+    # The primary key covers lookups by `user_id`
+    __table_args__ = (Index("ix_DeletedNotes_note_id", note_id),)
+
     def __init__(self, user_id: int, note_id: int):
         self.user_id = user_id
         self.note_id = note_id
+
+
+class NoteChange(db.Model):
+    """A change to the notes that a user sees, so that clients can sync
+    only what changed.
+
+    A change without a note means that any number of the user's notes may
+    have changed (such as after a bulk operation).
+    """
+
+    __tablename__ = "NoteChanges"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey(User.id), nullable=False)
+    # Not a foreign key, since the change must outlive unsent notes
+    note_id = Column(Integer, nullable=True)
+    # The user's data version that the change was made in. Unlike the id,
+    # it's assigned while the user's row is locked, so the changes of each
+    # user are committed in the order of their versions.
+    version = Column(Integer, nullable=False, server_default="0")
+    time = Column(DateTime(timezone=False), nullable=False)
+
+    # Match the lookups of `backend.note.get_changes()`
+    __table_args__ = (
+        Index("ix_NoteChanges_user_id_version", user_id, version),
+        Index("ix_NoteChanges_time", time),
+    )
+
+    def __init__(self, user_id: int, note_id: Optional[int], version: int):
+        self.user_id = user_id
+        self.note_id = note_id
+        self.version = version
+        self.time = datetime.utcnow()
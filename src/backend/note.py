@@ -4,14 +4,100 @@ Helper methods for notes.
 
 # =============================================================================
 
-import itertools
-from typing import List, Optional
-
-from sqlalchemy import and_, or_, select
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import (
+    Integer,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.orm.exc import StaleDataError
 
 import backend
-from backend._utils import query
-from backend.models import DeletedNote, DraftNote, FavoriteNote, Note, db
+from backend import _bus as bus
+from backend._utils import (
+    _exists,
+    commit,
+    insert_or_ignore,
+    load_users,
+    query,
+    rollback,
+)
+from backend.models import (
+    DeletedNote,
+    DraftNote,
+    FavoriteNote,
+    Note,
+    NoteChange,
+    User,
+    db,
+)
+
+# =============================================================================
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# A position in a list of notes sorted by most recently sent
+NoteCursor = Tuple[datetime, int]
+
+# The maximum number of changes to return at once; any more than this and
+# the client should just reload all the notes
+MAX_CHANGES = 200
+
+
+class Splice(NamedTuple):
+    """An edit to the text of a draft: deletes `delete_count` characters
+    at `start`, then inserts `text` there.
+
+    Positions are in UTF-16 code units, like JavaScript strings.
+    """
+
+    start: int
+    delete_count: int
+    text: str
+
+
+class DraftConflictError(ValueError):
+    """Raised when a draft is edited from an outdated version of it."""
+
+    def __init__(self):
+        super().__init__("Draft was changed elsewhere")
+
+
+# =============================================================================
+
+
+def _notes_changed(*user_ids: int) -> Dict[int, int]:
+    """Records that the notes (or drafts) that the given users see
+    changed, as part of the current transaction.
+
+    Returns the new data version of each user.
+    """
+    versions = backend.user.bump_data_versions(*user_ids)
+    bus.notes_changed(*user_ids)
+    return versions
+
+
+def _log_note_changes(versions: Dict[int, int], note_id: Optional[int]):
+    """Records that the given note changed for the users with the given
+    data versions (from `_notes_changed()`), as part of the current
+    transaction. If the note is None, any number of notes may have
+    changed.
+    """
+    db.session.add_all(
+        NoteChange(user_id, note_id, version)
+        for user_id, version in sorted(versions.items())
+    )
+
 
 # =============================================================================
 
@@ -21,7 +107,9 @@ def get_draft(draft_id: int) -> Optional[DraftNote]:
 
 
 def get_all_drafts(user_id: int) -> List[DraftNote]:
-    return query(DraftNote, DraftNote.user_id == user_id).all()
+    drafts = query(DraftNote, DraftNote.user_id == user_id).all()
+    load_users(drafts, "user", "recipient")
+    return drafts
 
 
 def create_draft(
@@ -39,7 +127,8 @@ def create_draft(
         raise ValueError("Can only send notes to friends")
 
     db.session.add(draft)
-    db.session.commit()
+    _notes_changed(user_id)
+    commit()
     return draft
 
 
@@ -64,25 +153,76 @@ def edit_draft(
         changed = True
 
     if changed:
-        db.session.commit()
+        _commit_draft(draft)
+
+    return draft
+
+
+def _apply_splices(text: str, splices: List[Splice]) -> str:
+    """Returns the given text with the given splices applied in order."""
+    # JavaScript counts characters in UTF-16 code units
+    units = text.encode("utf-16-le")
+    for start, delete_count, insert_text in splices:
+        end = start + delete_count
+        if not 0 <= start <= end <= len(units) // 2:
+            raise ValueError("Splice is out of range")
+        units = (
+            units[: start * 2]
+            + insert_text.encode("utf-16-le")
+            + units[end * 2 :]
+        )
+    try:
+        return units.decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise ValueError("Splice splits a character") from None
+
+
+def patch_draft(
+    draft: DraftNote, version: int, splices: List[Splice]
+) -> DraftNote:
+    """Applies the given splices to the text of the draft, which must
+    still be at the given version.
 
+    Raises a DraftConflictError if the draft has a different version, and
+    other errors if the splices are invalid in any way.
+    """
+    if draft.version != version:
+        raise DraftConflictError()
+    text = _apply_splices(draft.text, splices)
+    if text != draft.text:
+        draft.set_text(text)
+        _commit_draft(draft)
     return draft
 
 
+def _commit_draft(draft: DraftNote):
+    """Commits the changes to the given draft, which increments its
+    version. Raises a DraftConflictError if it was changed concurrently.
+    """
+    try:
+        _notes_changed(draft.user_id)
+        commit()
+    except StaleDataError:
+        rollback()
+        raise DraftConflictError() from None
+
+
 def delete_draft(draft: DraftNote):
     """Deletes the given draft."""
     db.session.delete(draft)
-    db.session.commit()
+    _notes_changed(draft.user_id)
+    commit()
 
 
 def delete_all_drafts(user_id: int):
     """Deletes all the drafts for the given user."""
-    drafts = get_all_drafts(user_id)
-    if len(drafts) == 0:
-        return
-    for draft in drafts:
-        db.session.delete(draft)
-    db.session.commit()
+    db.session.execute(
+        delete(DraftNote)
+        .where(DraftNote.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    _notes_changed(user_id)
+    commit()
 
 
 # =============================================================================
@@ -92,15 +232,55 @@ def get(note_id: int) -> Optional[Note]:
     return query(Note, Note.id == note_id).one_or_none()
 
 
-def get_all(user_id: int) -> List[Note]:
-    """Gets all the notes sent by or sent to the given user. The notes
-    will include whether they are favorited by the user.
+def make_cursor(note: Note) -> str:
+    """Returns a cursor pointing just past the given note."""
+    return f"{note.time_sent.isoformat()}_{note.id}"
+
+
+def parse_cursor(cursor: str) -> NoteCursor:
+    """Parses a cursor returned by `make_cursor()`.
 
-    The notes will be sorted by most recently sent.
+    Raises a ValueError if the cursor is invalid.
     """
-    # Include whether the note is favorited by the given user
-    notes_with_favorites = db.session.execute(
-        select(Note, FavoriteNote, DeletedNote)
+    time_sent, _, note_id = cursor.rpartition("_")
+    try:
+        return datetime.fromisoformat(time_sent), int(note_id)
+    except ValueError:
+        raise ValueError(f"invalid cursor: {cursor!r}") from None
+
+
+def _paginate(stmt, limit: int, before: Optional[NoteCursor]):
+    """Adds the ordering and keyset pagination for a page of notes to
+    the given statement.
+
+    One more note than the limit is fetched so that `_split_page()` can
+    tell if there is a next page.
+    """
+    if before is not None:
+        stmt = stmt.where(tuple_(Note.time_sent, Note.id) < before)
+    return stmt.order_by(Note.time_sent.desc(), Note.id.desc()).limit(
+        limit + 1
+    )
+
+
+def _split_page(
+    notes: List[Note], limit: int
+) -> Tuple[List[Note], Optional[str]]:
+    """Returns the page of notes and the cursor for the next page, or
+    None if this is the last page.
+    """
+    if len(notes) <= limit:
+        return notes, None
+    notes = notes[:limit]
+    return notes, make_cursor(notes[-1])
+
+
+def _select_visible_notes(user_id: int):
+    """Returns a statement that selects the notes sent by or sent to the
+    given user that they haven't deleted, along with their favorites.
+    """
+    return (
+        select(Note, FavoriteNote)
         .outerjoin(
             FavoriteNote,
             and_(
@@ -111,156 +291,537 @@ def get_all(user_id: int) -> List[Note]:
         .outerjoin(
             DeletedNote,
             and_(
-                DeletedNote.user_id == user_id, DeletedNote.note_id == Note.id
+                DeletedNote.user_id == user_id,
+                DeletedNote.note_id == Note.id,
             ),
         )
         .where(or_(Note.sender_id == user_id, Note.recipient_id == user_id))
+        # Don't include deleted notes
+        .where(DeletedNote.note_id.is_(None))
+    )
+
+
+def get_all(
+    user_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    before: Optional[NoteCursor] = None,
+) -> Tuple[List[Note], Optional[str]]:
+    """Gets a page of the notes sent by or sent to the given user. The
+    notes will include whether they are favorited by the user.
+
+    The notes will be sorted by most recently sent, starting after the
+    `before` cursor if given. Also returns the cursor for the next page,
+    or None if there are no more notes.
+    """
+    notes_with_favorites = db.session.execute(
+        _paginate(_select_visible_notes(user_id), limit, before)
     ).all()
     notes = []
-    for note, favorite, deleted in notes_with_favorites:
-        if deleted is not None:
-            # Don't include deleted notes
-            continue
+    for note, favorite in notes_with_favorites:
         note.set_favorited(favorite is not None)
         notes.append(note)
-    return sorted(notes, key=lambda n: n.time_sent, reverse=True)
+    notes, next_cursor = _split_page(notes, limit)
+    load_users(notes, "sender", "recipient")
+    return notes, next_cursor
 
 
-def create(user_id: int, recipient_id: int, text: str) -> Note:
-    """Creates a note with the given info.
+def _pop_draft(user_id: int, draft_id: int) -> Tuple[Optional[int], str]:
+    """Deletes the given draft as part of the current transaction, and
+    returns its recipient id and text.
 
-    Errors are raised if the args are invalid in any way.
+    Errors are raised if the draft doesn't exist or isn't the user's.
+    """
+    # Reads and deletes the draft in one statement
+    row = db.session.execute(
+        delete(DraftNote)
+        .where(DraftNote.id == draft_id, DraftNote.user_id == user_id)
+        .returning(DraftNote.recipient_id, DraftNote.text)
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+    if row is None:
+        # Only checked now, since this is the uncommon case
+        if _exists(DraftNote, DraftNote.id == draft_id):
+            raise ValueError("Draft does not belong to requesting user")
+        raise ValueError(f"Draft not found with ID: {draft_id}")
+    return row.recipient_id, row.text
+
+
+def send(
+    user_id: int,
+    recipient_id: Optional[int] = None,
+    text: Optional[str] = None,
+    draft_id: Optional[int] = None,
+) -> int:
+    """Sends a note with the given info. If a draft is given, it is
+    deleted, and it provides the recipient and text if they aren't given.
+
+    The friendship check, the new note, and the draft deletion are all
+    part of one transaction, so either the note is sent and the draft is
+    gone, or nothing changes. Errors are raised if the args are invalid
+    in any way. Returns the id of the new note.
     """
-    note = Note(user_id, recipient_id, text)
+    try:
+        if draft_id is not None:
+            draft_recipient_id, draft_text = _pop_draft(user_id, draft_id)
+            if recipient_id is None:
+                recipient_id = draft_recipient_id
+            if text is None:
+                text = draft_text
+            if recipient_id is None:
+                raise ValueError("Draft is not ready to send")
+            try:
+                note = Note(user_id, recipient_id, text)
+            except ValueError:
+                raise ValueError("Draft is not ready to send") from None
+        else:
+            note = Note(user_id, recipient_id, text)
+
+        # Sent notes can't be edited, so render them once
+        note.render_html()
+        # Only inserts the note if the users are friends, which saves
+        # checking first
+        note_id = db.session.scalar(
+            insert(Note)
+            .from_select(
+                [
+                    "sender_id",
+                    "recipient_id",
+                    "text",
+                    "time_sent",
+                    "html",
+                    "html_version",
+                ],
+                select(
+                    literal(note.sender_id, Note.sender_id.type),
+                    literal(note.recipient_id, Note.recipient_id.type),
+                    literal(note.text, Note.text.type),
+                    literal(note.time_sent, Note.time_sent.type),
+                    literal(note.html, Note.html.type),
+                    literal(note.html_version, Note.html_version.type),
+                ).where(
+                    backend.friend.friendship_exists(user_id, recipient_id)
+                ),
+            )
+            .returning(Note.id)
+        )
+        if note_id is None:
+            raise ValueError("Can only send notes to friends")
+    except ValueError:
+        # Restore the draft
+        rollback()
+        raise
 
-    if not backend.friend.are_friends(user_id, recipient_id):
-        raise ValueError("Can only send notes to friends")
+    versions = _notes_changed(user_id, recipient_id)
+    _log_note_changes(versions, note_id)
+    bus.note_sent(recipient_id)
+    commit()
+    return note_id
 
-    db.session.add(note)
-    db.session.commit()
-    return note
 
+def unsend(note: Note):
+    """Unsends the given note.
+
+    Its favorites and deletions are deleted through the cascading
+    foreign keys.
+    """
+    # Read before the delete is flushed, since the note may be expired
+    note_id, sender_id, recipient_id = (
+        note.id,
+        note.sender_id,
+        note.recipient_id,
+    )
+    db.session.delete(note)
+    versions = _notes_changed(sender_id, recipient_id)
+    _log_note_changes(versions, note_id)
+    bus.note_unsent(recipient_id)
+    commit()
 
-def toggle_favorite(user_id: int, note_id: int) -> bool:
-    """Toggles whether the note is favorited by the given user.
 
-    Returns whether the note is now favorited by the user.
+def unsend_all(user_id: int):
+    """Unsends all notes sent by the given user."""
+    recipient_ids = db.session.scalars(
+        delete(Note)
+        .where(Note.sender_id == user_id)
+        .returning(Note.recipient_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    versions = _notes_changed(user_id, *recipient_ids)
+    _log_note_changes(versions, None)
+    bus.note_unsent(*recipient_ids)
+    commit()
+
+
+# =============================================================================
+
+
+def get_deleted(
+    user_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    before: Optional[NoteCursor] = None,
+) -> Tuple[List[Note], Optional[str]]:
+    """Returns a page of the notes that the given user has deleted.
+
+    The notes are sorted by most recently sent, starting after the
+    `before` cursor if given. Also returns the cursor for the next page,
+    or None if there are no more notes.
     """
-    favorite = query(
+    notes = db.session.scalars(
+        _paginate(
+            select(Note).join(
+                DeletedNote,
+                and_(
+                    DeletedNote.user_id == user_id,
+                    DeletedNote.note_id == Note.id,
+                ),
+            ),
+            limit,
+            before,
+        )
+    ).all()
+    for note in notes:
+        note.set_deleted(True)
+    notes, next_cursor = _split_page(notes, limit)
+    load_users(notes, "sender", "recipient")
+    return notes, next_cursor
+
+
+def delete_all_received_notes(user_id: int) -> int:
+    """Deletes all the received notes for the given user only.
+
+    Returns the number of notes that were deleted (not including notes
+    that were already deleted).
+    """
+    result = db.session.execute(
+        insert(DeletedNote).from_select(
+            ["user_id", "note_id"],
+            select(literal(user_id, Integer), Note.id).where(
+                Note.recipient_id == user_id,
+                ~exists().where(
+                    DeletedNote.user_id == user_id,
+                    DeletedNote.note_id == Note.id,
+                ),
+            ),
+        )
+    )
+    versions = _notes_changed(user_id)
+    _log_note_changes(versions, None)
+    commit()
+    return result.rowcount
+
+
+def undelete_all_for_user(user_id: int) -> int:
+    """Undeletes all the notes that the given user has deleted.
+
+    Returns the number of notes that were undeleted.
+    """
+    result = db.session.execute(
+        delete(DeletedNote)
+        .where(DeletedNote.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    versions = _notes_changed(user_id)
+    _log_note_changes(versions, None)
+    commit()
+    return result.rowcount
+
+
+# =============================================================================
+
+
+def _select_own_note_ids(user_id: int, note_ids: Iterable[int]):
+    """Returns a statement that selects the user's id along with the ids
+    of the given notes that were sent by or sent to the user.
+    """
+    return select(literal(user_id, Integer), Note.id).where(
+        Note.id.in_(set(note_ids)),
+        or_(Note.sender_id == user_id, Note.recipient_id == user_id),
+    )
+
+
+def _is_own_note(user_id: int, note_id: int) -> bool:
+    """Returns whether the note exists and was sent by or sent to the
+    given user.
+    """
+    return _exists(
+        Note,
+        and_(
+            Note.id == note_id,
+            or_(Note.sender_id == user_id, Note.recipient_id == user_id),
+        ),
+    )
+
+
+# Each of these is a single statement that returns the ids of the notes
+# that changed, so concurrent requests (such as a double click) can't
+# conflict with each other
+
+
+def _add_favorites(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    return insert_or_ignore(
         FavoriteNote,
-        and_(FavoriteNote.user_id == user_id, FavoriteNote.note_id == note_id),
-    ).one_or_none()
-    if favorite is None:
-        # Add favorite
-        db.session.add(FavoriteNote(user_id, note_id))
-        db.session.commit()
-        return True
+        ["user_id", "note_id"],
+        _select_own_note_ids(user_id, note_ids),
+        FavoriteNote.note_id,
+    )
+
+
+def _remove_favorites(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    return db.session.scalars(
+        delete(FavoriteNote)
+        .where(
+            FavoriteNote.user_id == user_id,
+            FavoriteNote.note_id.in_(set(note_ids)),
+        )
+        .returning(FavoriteNote.note_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def _add_deletions(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    return insert_or_ignore(
+        DeletedNote,
+        ["user_id", "note_id"],
+        _select_own_note_ids(user_id, note_ids),
+        DeletedNote.note_id,
+    )
+
+
+def _remove_deletions(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    return db.session.scalars(
+        delete(DeletedNote)
+        .where(
+            DeletedNote.user_id == user_id,
+            DeletedNote.note_id.in_(set(note_ids)),
+        )
+        .returning(DeletedNote.note_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def _commit_changed(user_id: int, note_ids: List[int]) -> List[int]:
+    """Records that the given notes changed for the given user, and
+    commits. Returns the sorted note ids.
+    """
+    note_ids = sorted(note_ids)
+    if len(note_ids) > 0:
+        version = _notes_changed(user_id).get(user_id, None)
+        if version is not None:
+            db.session.add_all(
+                NoteChange(user_id, note_id, version) for note_id in note_ids
+            )
+        commit()
+    return note_ids
+
+
+def _set_state(
+    user_id: int, note_id: int, add, remove, value: bool
+) -> Optional[bool]:
+    """Adds or removes the given note's row for the given user with the
+    given functions.
+
+    Returns whether anything changed, or None if the note doesn't exist
+    or wasn't sent by or sent to the user.
+    """
+    if value:
+        changed_ids = add(user_id, [note_id])
     else:
-        # Delete favorite
-        db.session.delete(favorite)
-        db.session.commit()
+        changed_ids = remove(user_id, [note_id])
+    if len(changed_ids) == 0:
+        # It was already in that state, or it isn't the user's note (only
+        # checked now, since this is the uncommon case)
+        if not _is_own_note(user_id, note_id):
+            return None
         return False
+    _commit_changed(user_id, changed_ids)
+    return True
 
 
-def unsend(note: Note):
-    """Unsends the given note."""
-    # Couldn't really figure out cascading deletes, so manually delete
-    # all children
-    children = itertools.chain(
-        query(FavoriteNote, FavoriteNote.note_id == note.id).all(),
-        query(DeletedNote, DeletedNote.note_id == note.id).all(),
+def toggle_favorite(user_id: int, note_id: int) -> Optional[bool]:
+    """Toggles whether the note is favorited by the given user.
+
+    Returns whether the note is now favorited by the user, or None if the
+    note doesn't exist or wasn't sent by or sent to the user.
+    """
+    if len(_remove_favorites(user_id, [note_id])) > 0:
+        is_favorite = False
+    elif len(_add_favorites(user_id, [note_id])) > 0:
+        is_favorite = True
+    else:
+        return None
+    _commit_changed(user_id, [note_id])
+    return is_favorite
+
+
+def set_favorite(user_id: int, note_id: int, favorite: bool) -> Optional[bool]:
+    """Favorites or unfavorites the note for the given user.
+
+    Operation is idempotent. Returns whether the note changed, or None if
+    the note doesn't exist or wasn't sent by or sent to the user.
+    """
+    return _set_state(
+        user_id, note_id, _add_favorites, _remove_favorites, favorite
     )
-    for child in children:
-        db.session.delete(child)
-    db.session.delete(note)
-    db.session.commit()
 
 
-def unsend_all(user_id: int):
-    """Unsends all notes sent by the given user."""
-    notes = query(Note, Note.sender_id == user_id).all()
-    if len(notes) == 0:
-        return
-    # Manually delete all children
-    note_ids = set(note.id for note in notes)
-    children = itertools.chain(
-        query(FavoriteNote, FavoriteNote.note_id.in_(note_ids)).all(),
-        query(DeletedNote, DeletedNote.note_id.in_(note_ids)).all(),
+def set_deleted(user_id: int, note_id: int, deleted: bool) -> Optional[bool]:
+    """Deletes or undeletes the note for the given user only.
+
+    Operation is idempotent. Returns whether the note changed, or None if
+    the note doesn't exist or wasn't sent by or sent to the user.
+    """
+    return _set_state(
+        user_id, note_id, _add_deletions, _remove_deletions, deleted
     )
-    for child in children:
-        db.session.delete(child)
-    for note in notes:
-        db.session.delete(note)
-    db.session.commit()
 
 
-# =============================================================================
+def favorite_many(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    """Favorites the given notes for the given user, skipping any notes
+    that weren't sent by or sent to the user.
+
+    Returns the ids of the notes that weren't already favorited.
+    """
+    return _commit_changed(user_id, _add_favorites(user_id, note_ids))
 
 
-def get_deleted(user_id: int) -> List[Note]:
-    """Returns the notes that the given user has deleted.
+def unfavorite_many(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    """Unfavorites the given notes for the given user.
 
-    The notes are sorted by most recently sent.
+    Returns the ids of the notes that were favorited.
     """
-    deleted = query(DeletedNote, DeletedNote.user_id == user_id).all()
-    notes = []
-    for deleted_note in deleted:
-        note = deleted_note.note
-        note.set_deleted(True)
-        notes.append(note)
-    return sorted(notes, key=lambda n: n.time_sent, reverse=True)
+    return _commit_changed(user_id, _remove_favorites(user_id, note_ids))
 
 
-def delete_for_user(note: Note, user_id: int):
-    """Deletes the given note for the requesting user only.
+def delete_many_for_user(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    """Deletes the given notes for the given user only, skipping any
+    notes that weren't sent by or sent to the user.
 
-    Operation is idempotent: if the user has already deleted this note,
-    this has no effect.
+    Returns the ids of the notes that weren't already deleted.
     """
-    deleted = query(
-        DeletedNote,
-        and_(DeletedNote.user_id == user_id, DeletedNote.note_id == note.id),
-    ).one_or_none()
-    if deleted is not None:
-        return
-    db.session.add(DeletedNote(user_id, note.id))
-    db.session.commit()
+    return _commit_changed(user_id, _add_deletions(user_id, note_ids))
 
 
-def delete_all_received_notes(user_id: int):
-    """Deletes all the received notes for the given user only."""
-    notes_with_deleted = db.session.execute(
-        select(Note, DeletedNote)
-        .outerjoin(
-            DeletedNote,
-            and_(
-                DeletedNote.user_id == user_id, DeletedNote.note_id == Note.id
-            ),
+def undelete_many_for_user(user_id: int, note_ids: Iterable[int]) -> List[int]:
+    """Undeletes the given notes for the given user only.
+
+    Returns the ids of the notes that were deleted.
+    """
+    return _commit_changed(user_id, _remove_deletions(user_id, note_ids))
+
+
+# =============================================================================
+
+
+class NoteChanges(NamedTuple):
+    """The changes to the notes that a user sees since a cursor."""
+
+    # The notes that were added or changed, including whether they are
+    # favorited by the user
+    notes: List[Note]
+    # The ids of the notes that were removed (unsent or deleted)
+    removed_ids: List[int]
+    # The cursor to get the changes after these ones
+    cursor: str
+
+
+def _format_changes_cursor(version: int, latest_id: int) -> str:
+    return f"{version}.{latest_id}"
+
+
+def _parse_changes_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        version, latest_id = map(int, cursor.split("."))
+    except ValueError:
+        raise ValueError(f"invalid cursor: {cursor!r}") from None
+    return version, latest_id
+
+
+def get_changes_cursor(user_id: int) -> str:
+    """Returns a cursor for changes to the notes that the given user sees
+    after now.
+
+    The cursor holds the user's committed data version, so it comes before
+    the changes of any transaction that hasn't committed yet. It also holds
+    the latest change id, to tell whether the changes after it may have
+    been pruned.
+    """
+    version = db.session.scalar(
+        select(User.data_version).where(User.id == user_id)
+    )
+    latest_id = db.session.scalar(select(func.max(NoteChange.id)))
+    return _format_changes_cursor(version or 0, latest_id or 0)
+
+
+def get_changes(user_id: int, since: str) -> Optional[NoteChanges]:
+    """Returns the changes to the notes that the given user sees since
+    the given cursor (from `get_changes_cursor()` or a previous call).
+
+    Returns None if the client should reload all the notes instead, such
+    as when too many notes changed, or when the cursor is too old.
+
+    Raises a ValueError if the cursor is invalid.
+    """
+    if since.isdigit():
+        # A cursor from before the changes were ordered by data version
+        return None
+    since_version, since_id = _parse_changes_cursor(since)
+
+    oldest_id = db.session.scalar(select(func.min(NoteChange.id)))
+    if oldest_id is not None and since_id < oldest_id - 1:
+        # The changes since the cursor may have been pruned
+        return None
+
+    # Changes are ordered by the user's data version rather than by id,
+    # since ids are assigned in the order that changes are inserted rather
+    # than the order that they are committed
+    changes = db.session.execute(
+        select(NoteChange.id, NoteChange.note_id, NoteChange.version)
+        .where(
+            NoteChange.user_id == user_id,
+            NoteChange.version > since_version,
         )
-        .where(Note.recipient_id == user_id)
+        .order_by(NoteChange.version)
+        .limit(MAX_CHANGES + 1)
     ).all()
-    created = False
-    for note, deleted in notes_with_deleted:
-        if deleted is not None:
-            # Already deleted
-            continue
-        created = True
-        db.session.add(DeletedNote(user_id, note.id))
-    if created:
-        db.session.commit()
+    if len(changes) > MAX_CHANGES or any(
+        note_id is None for _, note_id, _ in changes
+    ):
+        return None
+    if len(changes) == 0:
+        return NoteChanges([], [], since)
+
+    # Rather than replaying the changes, just get the current state of each
+    # changed note
+    changed_ids = {note_id for _, note_id, _ in changes}
+    notes = []
+    for note, favorite in db.session.execute(
+        _select_visible_notes(user_id)
+        .where(Note.id.in_(changed_ids))
+        .order_by(Note.time_sent.desc(), Note.id.desc())
+    ):
+        note.set_favorited(favorite is not None)
+        notes.append(note)
+    load_users(notes, "sender", "recipient")
+    removed_ids = sorted(changed_ids - {note.id for note in notes})
+    latest_id = max(since_id, max(change.id for change in changes))
+    cursor = _format_changes_cursor(changes[-1].version, latest_id)
+    return NoteChanges(notes, removed_ids, cursor)
 
 
-def undelete_for_user(note: Note, user_id: int):
-    """Undeletes the given note for the requesting user only.
+def prune_changes(before: datetime) -> int:
+    """Deletes the changes to notes from before the given time. Clients
+    with older cursors will have to reload all their notes.
 
-    Operation is idempotent: if the user has not deleted this note, this
-    has no effect.
+    Returns the number of changes that were deleted.
     """
-    deleted = query(
-        DeletedNote,
-        and_(DeletedNote.user_id == user_id, DeletedNote.note_id == note.id),
-    ).one_or_none()
-    if deleted is None:
-        return
-    db.session.delete(deleted)
-    db.session.commit()
+    # Always keep the latest change, so that `get_changes()` can tell which
+    # cursors are too old
+    latest_id = db.session.scalar(select(func.max(NoteChange.id)))
+    if latest_id is None:
+        return 0
+    result = db.session.execute(
+        delete(NoteChange)
+        .where(NoteChange.time < before, NoteChange.id < latest_id)
+        .execution_options(synchronize_session=False)
+    )
+    commit()
+    return result.rowcount
@@ -0,0 +1,168 @@
+"""
+Streams of events to the connected clients of each user.
+
+Each worker keeps the streams of its own clients, and fans out the events
+it receives from the bus (see `backend._bus`), which carries them across
+workers. The events are only hints to fetch the latest data, so events
+that are missed (such as while a client reconnects) only delay updates.
+"""
+
+# =============================================================================
+
+import threading
+from typing import Dict, List, Optional, Set
+
+from backend import _bus as bus
+
+# =============================================================================
+
+__all__ = (
+    "NOTE",
+    "NOTE_UNSENT",
+    "FRIEND_REQUEST",
+    "RESYNC",
+    "Stream",
+    "connect",
+    "get_stats",
+    "init_app",
+)
+
+# =============================================================================
+
+# The event names sent to clients
+NOTE = "note"
+NOTE_UNSENT = "note-unsent"
+FRIEND_REQUEST = "friend-request"
+# Sent when events may have been missed, so clients should fetch everything
+RESYNC = "resync"
+
+# =============================================================================
+
+_streams: Dict[int, Set["Stream"]] = {}
+_num_streams = 0
+_streams_lock = threading.Lock()
+
+# Whether streams are enabled, and the maximum number of open streams in
+# this worker
+_enabled = False
+_max_streams = 0
+
+# =============================================================================
+
+
+class Stream:
+    """The pending events of one connected client.
+
+    Events that haven't been sent yet are coalesced, so a slow client
+    never has more than one of each event waiting.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # A dict as an ordered set
+        self._pending: Dict[str, None] = {}
+        self._condition = threading.Condition()
+
+    def push(self, event_name: str):
+        """Adds the given event to be sent to this client."""
+        with self._condition:
+            self._pending[event_name] = None
+            self._condition.notify()
+
+    def wait(self, timeout: float) -> List[str]:
+        """Waits up to the given number of seconds for events, and returns
+        them (or an empty list if there were none).
+        """
+        with self._condition:
+            if len(self._pending) == 0:
+                self._condition.wait(timeout)
+            event_names = list(self._pending)
+            self._pending.clear()
+            return event_names
+
+    def close(self):
+        """Stops sending events to this client."""
+        global _num_streams  # pylint: disable=global-statement
+
+        with _streams_lock:
+            user_streams = _streams.get(self.user_id, None)
+            if user_streams is None or self not in user_streams:
+                return
+            user_streams.remove(self)
+            if len(user_streams) == 0:
+                del _streams[self.user_id]
+            _num_streams -= 1
+
+
+def connect(user_id: int) -> Optional[Stream]:
+    """Opens a stream of events for the given user.
+
+    Returns None if streams are disabled, or if this worker already has
+    too many open streams. The stream must be closed when the client
+    disconnects.
+    """
+    global _num_streams  # pylint: disable=global-statement
+
+    if not _enabled:
+        return None
+    stream = Stream(user_id)
+    with _streams_lock:
+        if _num_streams >= _max_streams:
+            return None
+        _streams.setdefault(user_id, set()).add(stream)
+        _num_streams += 1
+    return stream
+
+
+def get_stats():
+    """Returns the number of open streams in this worker."""
+    with _streams_lock:
+        return {
+            "enabled": _enabled,
+            "streams": _num_streams,
+            "users": len(_streams),
+            "maxStreams": _max_streams,
+        }
+
+
+# =============================================================================
+
+
+def _fan_out(event_name: str):
+    """Returns a bus handler that pushes the given event to the streams
+    of the users in each bus event.
+    """
+
+    def handler(user_ids):
+        with _streams_lock:
+            if user_ids is None:
+                event = RESYNC
+                streams = [
+                    stream
+                    for user_streams in _streams.values()
+                    for stream in user_streams
+                ]
+            else:
+                event = event_name
+                streams = [
+                    stream
+                    for user_id in user_ids
+                    for stream in _streams.get(user_id, ())
+                ]
+        for stream in streams:
+            stream.push(event)
+
+    return handler
+
+
+def init_app(app):
+    """Sets up the streams for the app."""
+    global _enabled, _max_streams  # pylint: disable=global-statement
+
+    _enabled = app.config["STREAM_ENABLED"]
+    _max_streams = app.config["STREAM_MAX_CONNECTIONS"]
+    if _enabled:
+        # Otherwise the bus doesn't need to publish these events at all
+        bus.subscribe(bus.NOTE_SENT, _fan_out(NOTE))
+        bus.subscribe(bus.NOTE_UNSENT, _fan_out(NOTE_UNSENT))
+        bus.subscribe(bus.FRIEND_REQUEST_SENT, _fan_out(FRIEND_REQUEST))
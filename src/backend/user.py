@@ -4,27 +4,83 @@ Helper methods for Users.
 
 # =============================================================================
 
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-from backend._utils import _exists, query
+from sqlalchemy import select, update
+
+import backend
+from backend import _bus as bus
+from backend._cache import LRUCache
+from backend._utils import _exists, commit, query
 from backend.models import User, db
 
 # =============================================================================
 
+# The data version of each user, by user id. Configured from the app config
+# in `backend.init_app()`.
+data_versions_cache = LRUCache()
+
+
+def _invalidate_data_versions_cache(user_ids: Optional[Tuple[int, ...]]):
+    if user_ids is None:
+        data_versions_cache.clear()
+    else:
+        data_versions_cache.invalidate(*user_ids)
+
+
+bus.subscribe(bus.DATA_VERSIONS_CHANGED, _invalidate_data_versions_cache)
+
+# The keys in `Session.info` of the users loaded in the current session
+# (which lasts for one request) by id, and of their ids by username
+_LOADED_USERS_KEY = "loaded_users"
+_USERNAME_IDS_KEY = "user_ids_by_username"
+
+# =============================================================================
+
+
+def _keep_loaded(user: Optional[User]) -> Optional[User]:
+    """Keeps the given user loaded for the rest of the current session.
+
+    The session's identity map only holds weak references, so otherwise
+    a user that is looked up again later in the request (after the first
+    one is no longer used) would be queried again.
+    """
+    if user is not None:
+        db.session.info.setdefault(_LOADED_USERS_KEY, {})[user.id] = user
+    return user
+
 
 def get(user_id: int) -> Optional[User]:
-    """Returns the requested user, or returns None if they don't exist."""
-    return query(User, User.id == user_id).one_or_none()
+    """Returns the requested user, or returns None if they don't exist.
+
+    Users that were already loaded in the current request are returned
+    without querying again.
+    """
+    return _keep_loaded(db.session.get(User, user_id))
 
 
 def get_by_email(email: str) -> Optional[User]:
     """Returns the requested user, or returns None if they don't exist."""
-    return query(User, User.email == email).one_or_none()
+    return _keep_loaded(query(User, User.email == email).one_or_none())
 
 
 def get_by_username(username: str) -> Optional[User]:
-    """Returns the requested user, or returns None if they don't exist."""
-    return query(User, User.username == username).one_or_none()
+    """Returns the requested user, or returns None if they don't exist.
+
+    Like `get()`, a user that was already looked up in the current
+    request is returned without querying again.
+    """
+    user_ids = db.session.info.setdefault(_USERNAME_IDS_KEY, {})
+    user_id = user_ids.get(username, None)
+    if user_id is not None:
+        user = get(user_id)
+        # The username may have changed since
+        if user is not None and user.username == username:
+            return user
+    user = query(User, User.username == username).one_or_none()
+    if user is not None:
+        user_ids[username] = user.id
+    return _keep_loaded(user)
 
 
 # =============================================================================
@@ -41,7 +97,7 @@ def create(email: str, username: str, display_name: str) -> User:
         raise ValueError(f'Username "{user.username}" is already taken')
 
     db.session.add(user)
-    db.session.commit()
+    commit()
     return user
 
 
@@ -63,6 +119,70 @@ def edit(user: User, username: str, display_name: str) -> User:
         changed = True
 
     if changed:
-        db.session.commit()
+        # The user's name is shown in the lists of other users too. Don't
+        # flush the changes to the user's row until all the rows are locked
+        # in order.
+        with db.session.no_autoflush:
+            bump_data_versions(
+                user.id, *backend.friend.get_related_user_ids(user.id)
+            )
+        bus.user_changed(user.id)
+        commit()
 
     return user
+
+
+# =============================================================================
+
+
+def get_data_version(user_id: int) -> Optional[int]:
+    """Returns the version of the data that the given user can see, or
+    None if the user doesn't exist.
+
+    The version increases whenever any of the user's notes, drafts,
+    friends, or friend requests change.
+    """
+    version = data_versions_cache.get(user_id)
+    if version is None:
+        # Taken before reading, so that a version that was read while it
+        # was invalidated isn't cached
+        token = data_versions_cache.fill_token()
+        version = db.session.scalar(
+            select(User.data_version).where(User.id == user_id)
+        )
+        if version is None:
+            return None
+        data_versions_cache.set(user_id, version, token)
+    return version
+
+
+def bump_data_versions(*user_ids: int) -> Dict[int, int]:
+    """Increments the data versions of the given users as part of the
+    current transaction, and returns the new version of each user.
+
+    The users' rows stay locked until the transaction ends, so the
+    versions of each user are committed in order. To avoid deadlocks, the
+    rows are locked in order of id before they're updated (since an
+    `UPDATE` locks them in whatever order it finds them). This should be
+    called before any other changes to the users' rows in the transaction.
+    """
+    user_ids = sorted(set(user_ids))
+    if len(user_ids) == 0:
+        return {}
+    # The same lock as the update takes, which still allows inserting rows
+    # that refer to the users
+    db.session.execute(
+        select(User.id)
+        .where(User.id.in_(user_ids))
+        .order_by(User.id)
+        .with_for_update(key_share=True)
+    ).all()
+    versions = db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(data_version=User.data_version + 1)
+        .returning(User.id, User.data_version)
+        .execution_options(synchronize_session=False)
+    ).all()
+    bus.data_versions_changed(*user_ids)
+    return dict(versions)
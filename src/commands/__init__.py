@@ -0,0 +1,23 @@
+"""
+Custom `flask` CLI commands for the app.
+"""
+
+# =============================================================================
+
+from commands import assets, bench, explain, prune, render, seed
+
+# =============================================================================
+
+
+def register_all(app):
+    """Registers all the defined commands to the app."""
+
+    for module in (
+        explain,
+        seed,
+        bench,
+        render,
+        prune,
+        assets,
+    ):
+        app.cli.add_command(module.command)
@@ -0,0 +1,88 @@
+"""
+A command to build the static assets for serving.
+
+Usage: `flask build-assets`
+
+Each asset (see `utils.assets`) is copied to `static/dist/` with a hash of
+its content in its name, along with gzip and Brotli compressed variants,
+so that it can be cached forever and served without compressing it on
+every request. Brotli variants are skipped in development environments
+without the `brotli` package (which is a dependency). Run this whenever the assets change (`build.sh` runs it on each
+deployment).
+"""
+
+# =============================================================================
+
+import gzip
+import hashlib
+import json
+import shutil
+
+import click
+
+from utils import STATIC_FOLDER
+from utils.assets import ASSET_SUFFIXES, DIST_FOLDER, ENCODINGS, MANIFEST_FILE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# =============================================================================
+
+# The length of the content hash in the built filenames
+HASH_LENGTH = 12
+
+# =============================================================================
+
+
+def _compress(encoding, content):
+    if encoding == "gzip":
+        # Without a timestamp, so that builds are reproducible
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(content, mode=brotli.MODE_TEXT)
+    return None
+
+
+def build_assets():
+    """Builds the assets, and returns the manifest of the built files."""
+    if DIST_FOLDER.exists():
+        shutil.rmtree(DIST_FOLDER)
+    DIST_FOLDER.mkdir()
+
+    manifest = {}
+    for path in sorted(STATIC_FOLDER.iterdir()):
+        if not path.is_file() or path.suffix not in ASSET_SUFFIXES:
+            continue
+        content = path.read_bytes()
+        content_hash = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        filename = f"{path.stem}.{content_hash}{path.suffix}"
+        (DIST_FOLDER / filename).write_bytes(content)
+
+        encodings = []
+        for encoding, suffix in ENCODINGS:
+            compressed = _compress(encoding, content)
+            if compressed is None or len(compressed) >= len(content):
+                continue
+            (DIST_FOLDER / f"{filename}{suffix}").write_bytes(compressed)
+            encodings.append(encoding)
+
+        manifest[path.name] = {"file": filename, "encodings": encodings}
+
+    MANIFEST_FILE.write_text(json.dumps(manifest, indent=2) + "\n")
+    return manifest
+
+
+# =============================================================================
+
+
+@click.command("build-assets")
+def command():
+    """Build the fingerprinted and precompressed static assets."""
+    manifest = build_assets()
+    for original, asset in manifest.items():
+        encodings = ", ".join(asset["encodings"]) or "uncompressed"
+        click.echo(f"{original} -> {asset['file']} ({encodings})")
+    if brotli is None:
+        click.echo("Skipped Brotli variants (the `brotli` package is missing)")
@@ -0,0 +1,325 @@
+"""
+A command to benchmark the backend and API at several data sizes.
+
+Usage: `flask bench [OPTIONS]` (see `flask bench --help`)
+
+For each size, the database is cleared and seeded (see `commands.seed`),
+then each benchmark is run as the first power user. The results are
+written as JSON so that runs on different branches can be compared.
+
+This deletes all the data in the configured database, so only run it
+against a local database. For example:
+
+    SQLALCHEMY_DATABASE_URI=sqlite:///bench.db flask bench -o report.json
+"""
+
+# =============================================================================
+
+import json
+import platform
+import statistics
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, select
+
+import backend
+from backend.models import User, db
+from commands.seed import clear_database, seed_database
+from utils import json_provider
+from utils.compression import get_encodings
+
+# =============================================================================
+
+# Benchmarks of backend methods, which are called with the power user's id
+BACKEND_BENCHMARKS = (
+    ("note.get_all", lambda user_id: backend.note.get_all(user_id)),
+    ("note.get_deleted", lambda user_id: backend.note.get_deleted(user_id)),
+    (
+        "note.get_all_drafts",
+        lambda user_id: backend.note.get_all_drafts(user_id),
+    ),
+    ("friend.get_all", lambda user_id: backend.friend.get_all(user_id)),
+    (
+        "friend.get_outgoing_friend_requests",
+        lambda user_id: backend.friend.get_outgoing_friend_requests(user_id),
+    ),
+    (
+        "friend.get_incoming_friend_requests",
+        lambda user_id: backend.friend.get_incoming_friend_requests(user_id),
+    ),
+)
+
+# Benchmarks of API endpoints, as (endpoint, url args)
+API_BENCHMARKS = (
+    ("list_notes", {}),
+    # The largest page of the feed
+    ("list_notes", {"limit": backend.note.MAX_PAGE_SIZE}),
+    ("list_notes", {"html": "true"}),
+    ("list_deleted_notes", {"html": "true"}),
+    ("list_drafts", {"html": "true"}),
+    ("list_user_friends", {}),
+    ("list_user_outgoing_friend_requests", {}),
+    ("list_user_incoming_friend_requests", {}),
+)
+
+# Benchmarks of the bytes on the wire and the time taken by compression, as
+# (endpoint, url args). Each is requested with each supported encoding, as
+# well as without one.
+COMPRESSION_BENCHMARKS = (
+    ("list_notes", {"html": "true"}),
+    ("list_deleted_notes", {"html": "true"}),
+    ("list_drafts", {"html": "true"}),
+)
+
+# Benchmarks of sending a note to a friend, as (name, whether to send a
+# draft). Each run sends a new note.
+SEND_BENCHMARKS = (
+    ("POST /api/drafts/send", False),
+    ("POST /api/drafts/send (draft)", True),
+)
+
+# =============================================================================
+
+
+@contextmanager
+def _count_statements():
+    """Counts the statements that are executed on the database engine.
+
+    The count is the single element of the yielded list.
+    """
+    count = [0]
+
+    def before_cursor_execute(*args):  # pylint: disable=unused-argument
+        count[0] += 1
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield count
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _time(run, repeat, setup=None):
+    """Times the given function, and returns the summarized results.
+
+    The function may return the size of its response in bytes. If a setup
+    function is given, it is called before each run (untimed), and the
+    function is called with its result.
+    """
+
+    def run_once():
+        args = () if setup is None else (setup(),)
+        with _count_statements() as statements:
+            start = perf_counter()
+            response_bytes = run(*args)
+            elapsed = perf_counter() - start
+        return response_bytes, elapsed * 1000, statements[0]
+
+    # Warm up any caches (and the database's) before timing
+    run_once()
+
+    times = []
+    for _ in range(repeat):
+        response_bytes, elapsed, num_statements = run_once()
+        times.append(elapsed)
+
+    times.sort()
+    results = {
+        "runs": repeat,
+        "statements": num_statements,
+        "minMs": times[0],
+        "medianMs": statistics.median(times),
+        "meanMs": statistics.mean(times),
+        "p95Ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "maxMs": times[-1],
+    }
+    if response_bytes is not None:
+        results["bytes"] = response_bytes
+    return results
+
+
+def _count_rows():
+    """Returns the number of rows in each table."""
+    return {
+        table.name: db.session.scalar(select(func.count()).select_from(table))
+        for table in db.metadata.sorted_tables
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# =============================================================================
+
+
+def run_benchmarks(user_id, repeat):
+    """Runs all the benchmarks as the given user."""
+    results = {}
+
+    for name, run in BACKEND_BENCHMARKS:
+
+        def run_backend(run=run):
+            # Start with an empty identity map, as a request would
+            db.session.remove()
+            run(user_id)
+
+        results[name] = _time(run_backend, repeat)
+
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session["email"] = db.session.get(User, user_id).email
+    for endpoint, args in API_BENCHMARKS:
+        with current_app.test_request_context():
+            url = url_for(endpoint, **args)
+
+        def run_api(url=url):
+            # The app redirects plain HTTP requests
+            response = client.get(url, base_url="https://localhost")
+            if response.status_code != 200:
+                raise click.ClickException(
+                    f"GET {url} returned status {response.status_code}"
+                )
+            return len(response.get_data())
+
+        results[f"GET {url}"] = _time(run_api, repeat)
+
+    for endpoint, args in COMPRESSION_BENCHMARKS:
+        with current_app.test_request_context():
+            url = url_for(endpoint, **args)
+        for encoding in ("identity", *get_encodings()):
+
+            def run_compressed(url=url, encoding=encoding):
+                response = client.get(
+                    url,
+                    headers={"Accept-Encoding": encoding},
+                    base_url="https://localhost",
+                )
+                if response.status_code != 200:
+                    raise click.ClickException(
+                        f"GET {url} returned status {response.status_code}"
+                    )
+                return len(response.get_data())
+
+            results[f"GET {url} ({encoding})"] = _time(run_compressed, repeat)
+
+    with current_app.test_request_context():
+        send_url = url_for("send_draft")
+    friend_id = backend.friend.get_all(user_id, limit=1)[0][0].id
+    # The test client can't send CSRF tokens
+    csrf_enabled = current_app.config.get("WTF_CSRF_ENABLED", True)
+    current_app.config["WTF_CSRF_ENABLED"] = False
+    try:
+        for name, send_draft in SEND_BENCHMARKS:
+
+            def setup_send(send_draft=send_draft):
+                if not send_draft:
+                    return {"recipientId": friend_id, "text": "Benchmark"}
+                draft = backend.note.create_draft(
+                    user_id, friend_id, "Benchmark"
+                )
+                return {"draftId": draft.id}
+
+            def run_send(args):
+                response = client.post(
+                    send_url, json=args, base_url="https://localhost"
+                )
+                if response.status_code != 200:
+                    raise click.ClickException(
+                        f"POST {send_url} returned status "
+                        f"{response.status_code}"
+                    )
+                if not response.get_json()["success"]:
+                    raise click.ClickException(
+                        f"Sending failed: {response.get_json()['error']}"
+                    )
+                return len(response.get_data())
+
+            results[name] = _time(run_send, repeat, setup_send)
+    finally:
+        current_app.config["WTF_CSRF_ENABLED"] = csrf_enabled
+
+    return results
+
+
+@click.command("bench")
+@click.option(
+    "--sizes",
+    default="100,1000",
+    show_default=True,
+    help="Comma-separated numbers of users to seed.",
+)
+@click.option("--notes", "notes_per_user", default=20, show_default=True)
+@click.option(
+    "--power-factor",
+    default=50,
+    show_default=True,
+    help="How many times more data the power user has.",
+)
+@click.option("--repeat", default=10, show_default=True)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the JSON report to.",
+)
+@click.confirmation_option(
+    prompt="This will delete ALL data in the configured database. Continue?"
+)
+@with_appcontext
+def command(sizes, notes_per_user, power_factor, repeat, output):
+    """Benchmark the backend and API against seeded data."""
+    try:
+        sizes = [int(size) for size in sizes.split(",")]
+    except ValueError:
+        raise click.BadParameter(
+            "expected comma-separated ints", param_hint="--sizes"
+        ) from None
+
+    db.create_all()
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "gitCommit": _git_commit(),
+        "python": platform.python_version(),
+        "database": db.engine.dialect.name,
+        "jsonLibrary": json_provider.get_library(),
+        "repeat": repeat,
+        "sizes": [],
+    }
+    for size in sizes:
+        click.echo(f"Seeding {size} users...", err=True)
+        clear_database()
+        user_ids = seed_database(
+            num_users=size,
+            notes_per_user=notes_per_user,
+            power_factor=power_factor,
+        )
+        click.echo(f"Benchmarking {size} users...", err=True)
+        report["sizes"].append(
+            {
+                "users": size,
+                "notesPerUser": notes_per_user,
+                "powerFactor": power_factor,
+                "rows": _count_rows(),
+                "results": run_benchmarks(user_ids[0], repeat),
+            }
+        )
+
+    json.dump(report, output, indent=2)
+    output.write("\n")
@@ -0,0 +1,406 @@
+"""
+A command to print the query plans of the hot database queries.
+
+Usage: `flask explain [--user-id ID] [--other-id ID] [--seed]`
+
+Each query is run through the real backend method, and every statement
+it executes is captured and run again with `EXPLAIN`. The command fails
+if any plan contains a full table scan, or if any query executes more
+statements than expected (which usually means something is being lazy
+loaded once per row). The hot API endpoints (including the ones that
+render notes as HTML) are requested through the test client and checked
+the same way. Run it as a user with lots of data to check that the number
+of statements stays fixed.
+
+The command exits with a non-zero status if any check fails, so it can
+be run in CI. Since a fresh database has no rows to lazy load, pass
+`--seed` there to seed synthetic data first (see `commands.seed`) and
+check the queries as its power user. Then every query that loads related
+rows must also return some, so that none of the checks pass vacuously:
+
+    SQLALCHEMY_DATABASE_URI=sqlite:///explain.db flask explain --seed
+"""
+
+# =============================================================================
+
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import event, or_, select
+
+import backend
+from backend._utils import query
+from backend.models import (
+    DeletedNote,
+    FavoriteNote,
+    Friendship,
+    Note,
+    User,
+    db,
+)
+from commands.seed import seed_database
+
+# =============================================================================
+
+
+def _get_changes_json(user_id):
+    changes = backend.note.get_changes(user_id, "0.0")
+    if changes is None:
+        # Too many changes
+        return []
+    return [note.to_json() for note in changes.notes]
+
+
+# Each hot query is called with the ids of two (possibly nonexistent)
+# users, and may execute at most the given number of statements no matter
+# how much data there is. List queries are serialized so that any lazy
+# loads are counted as well.
+HOT_QUERIES = (
+    (
+        "note.get_all",
+        2,
+        lambda user_id, _: [
+            note.to_json() for note in backend.note.get_all(user_id)[0]
+        ],
+    ),
+    (
+        "note.get_all (next page)",
+        2,
+        lambda user_id, _: [
+            note.to_json()
+            for note in backend.note.get_all(
+                user_id, before=(datetime.utcnow(), 0)
+            )[0]
+        ],
+    ),
+    (
+        "note.get_deleted",
+        2,
+        lambda user_id, _: [
+            note.to_json() for note in backend.note.get_deleted(user_id)[0]
+        ],
+    ),
+    (
+        "note.get_changes",
+        4,
+        lambda user_id, _: _get_changes_json(user_id),
+    ),
+    (
+        "note.get_all_drafts",
+        2,
+        lambda user_id, _: [
+            draft.to_json() for draft in backend.note.get_all_drafts(user_id)
+        ],
+    ),
+    (
+        "notes sent by user (deleted by note.unsend_all)",
+        1,
+        lambda user_id, _: query(Note, Note.sender_id == user_id).all(),
+    ),
+    (
+        "favorites of note (cascaded by note.unsend)",
+        1,
+        lambda _, note_id: query(
+            FavoriteNote, FavoriteNote.note_id == note_id
+        ).all(),
+    ),
+    (
+        "deletions of note (cascaded by note.unsend)",
+        1,
+        lambda _, note_id: query(
+            DeletedNote, DeletedNote.note_id == note_id
+        ).all(),
+    ),
+    (
+        "friend.get_all",
+        2,
+        lambda user_id, _: [
+            friend.to_json() for friend in backend.friend.get_all(user_id)[0]
+        ],
+    ),
+    (
+        "friend.get_all (prefix, page)",
+        2,
+        lambda user_id, _: [
+            friend.to_json()
+            for friend in backend.friend.get_all(
+                user_id, prefix="s", limit=50, after="s"
+            )[0]
+        ],
+    ),
+    (
+        "friend.are_friends",
+        1,
+        lambda user_id, other_id: backend.friend.are_friends(
+            user_id, other_id
+        ),
+    ),
+    (
+        "friendships of user (deleted by friend.remove_all)",
+        1,
+        lambda user_id, _: query(
+            Friendship,
+            or_(
+                Friendship.user1_id == user_id,
+                Friendship.user2_id == user_id,
+            ),
+        ).all(),
+    ),
+    (
+        "friend.get_outgoing_friend_requests",
+        2,
+        lambda user_id, _: [
+            user.to_json()
+            for user in backend.friend.get_outgoing_friend_requests(user_id)
+        ],
+    ),
+    (
+        "friend.get_incoming_friend_requests",
+        2,
+        lambda user_id, _: [
+            user.to_json()
+            for user in backend.friend.get_incoming_friend_requests(user_id)
+        ],
+    ),
+    (
+        "friend.has_sent_request",
+        1,
+        lambda user_id, other_id: backend.friend.has_sent_request(
+            user_id, other_id
+        ),
+    ),
+    (
+        "friend.get_nickname",
+        1,
+        lambda user_id, other_id: backend.friend.get_nickname(
+            user_id, other_id
+        ),
+    ),
+)
+
+# Each hot endpoint is requested as the user, as (endpoint, url args, the
+# max number of statements, the key of the listed items in the response).
+# The statements include loading the user's data version (but not the
+# session user, which is saved in the session after the first request).
+HOT_ENDPOINTS = (
+    ("list_notes", {}, 5, "notes"),
+    ("list_notes", {"html": "true"}, 5, "numNotes"),
+    ("list_deleted_notes", {"html": "true"}, 3, "numNotes"),
+    ("list_note_changes", {"since": "0.0"}, 5, "notes"),
+    ("list_drafts", {}, 3, "notes"),
+    ("list_drafts", {"html": "true"}, 3, "numNotes"),
+    ("list_user_friends", {}, 3, "users"),
+    ("list_user_outgoing_friend_requests", {}, 3, "users"),
+    ("list_user_incoming_friend_requests", {}, 3, "users"),
+)
+
+# =============================================================================
+
+
+@contextmanager
+def _capture_statements():
+    """Collects the statements (and their parameters) that are executed
+    on the database engine.
+    """
+    statements = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):  # pylint: disable=unused-argument,too-many-arguments
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _explain(statement, parameters):
+    """Returns the lines of the query plan for the given statement, and
+    whether the plan does a full table scan.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).all()
+        # Each row is (id, parent, notused, detail)
+        lines = [row[-1] for row in rows]
+        full_scan = any(
+            line.startswith("SCAN ") and "INDEX" not in line for line in lines
+        )
+    else:
+        rows = connection.exec_driver_sql(
+            f"EXPLAIN {statement}", parameters
+        ).all()
+        lines = [row[0] for row in rows]
+        full_scan = any("Seq Scan" in line for line in lines)
+    return lines, full_scan
+
+
+def _seed():
+    """Seeds a small amount of synthetic data, and returns the ids of its
+    power user and one of their friends.
+    """
+    db.create_all()
+    # The power user has friends, and also other users to send friend
+    # requests to and receive them from
+    user_ids = seed_database(num_users=50, friends_per_user=2, power_factor=10)
+    user_id = user_ids[0]
+    friend_id = db.session.scalars(
+        select(Friendship.user2_id)
+        .where(Friendship.user1_id == user_id)
+        .limit(1)
+    ).first()
+    return user_id, friend_id
+
+
+def _check(name, max_statements, run):
+    """Runs the given function, and prints the query plans of the
+    statements it executes.
+
+    Returns the function's result and the failed checks.
+    """
+    failures = []
+    # Start with empty caches so that the statements behind them are
+    # explained too
+    backend.friend.friends_cache.clear()
+    backend.user.data_versions_cache.clear()
+    with _capture_statements() as statements:
+        result = run()
+    click.echo(f"=== {name} ({len(statements)} statements)")
+    if len(statements) > max_statements:
+        failures.append(
+            f"{name}: {len(statements)} statements (expected at most "
+            f"{max_statements})"
+        )
+    explained = set()
+    for statement, parameters in statements:
+        if statement in explained:
+            continue
+        explained.add(statement)
+        click.echo(statement)
+        lines, full_scan = _explain(statement, parameters)
+        for line in lines:
+            click.echo(f"  {line}")
+        if full_scan:
+            failures.append(f"{name}: full table scan")
+    click.echo()
+    return result, failures
+
+
+def _request(client, url):
+    """Requests the given url with the test client, and returns the JSON
+    response.
+    """
+    # The app redirects plain HTTP requests
+    response = client.get(url, base_url="https://localhost")
+    if response.status_code != 200:
+        raise click.ClickException(
+            f"GET {url} returned status {response.status_code}"
+        )
+    result = response.get_json()
+    if not result["success"]:
+        raise click.ClickException(f"GET {url} failed: {result['error']}")
+    return result
+
+
+# =============================================================================
+
+
+@click.command("explain")
+@click.option("--user-id", type=int, default=1, help="The user to query.")
+@click.option(
+    "--other-id", type=int, default=2, help="A friend or note of the user."
+)
+@click.option(
+    "--seed",
+    is_flag=True,
+    help="Seed synthetic data first, and query as its power user.",
+)
+@with_appcontext
+def command(user_id, other_id, seed):
+    """Print and check the query plans of the hot database queries."""
+    if seed:
+        user_id, other_id = _seed()
+        click.echo(
+            f"Seeded synthetic data (user {user_id}, friend {other_id})",
+            err=True,
+        )
+    elif (
+        db.session.scalars(
+            select(Note.id)
+            .where(
+                or_(Note.sender_id == user_id, Note.recipient_id == user_id)
+            )
+            .limit(1)
+        ).first()
+        is None
+    ):
+        click.echo(
+            f"Warning: user {user_id} has no notes, so the statement counts "
+            "may be too low (pass --seed to seed synthetic data)",
+            err=True,
+        )
+
+    if db.session.connection().dialect.name == "postgresql":
+        # Small development tables are faster to scan than to search, so
+        # disable sequential scans to check that an index *can* be used
+        db.session.execute(db.text("SET LOCAL enable_seqscan = off"))
+
+    failures = []
+    empty = []
+    for name, max_statements, run_query in HOT_QUERIES:
+        result, query_failures = _check(
+            name,
+            max_statements,
+            lambda run_query=run_query: run_query(user_id, other_id),
+        )
+        failures.extend(query_failures)
+        # Queries of a single statement don't load any related rows
+        if max_statements > 1 and not result:
+            empty.append(name)
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        click.echo(
+            f"Skipped the endpoints (user {user_id} doesn't exist)", err=True
+        )
+    else:
+        client = current_app.test_client()
+        with client.session_transaction() as session:
+            session["email"] = user.email
+        # Log in, so that the session user is saved in the session
+        with current_app.test_request_context():
+            _request(client, url_for("list_user_friends"))
+        for endpoint, args, max_statements, items_key in HOT_ENDPOINTS:
+            with current_app.test_request_context():
+                url = url_for(endpoint, **args)
+            # Start with an empty identity map, as a request would
+            db.session.expire_all()
+            result, endpoint_failures = _check(
+                f"GET {url}",
+                max_statements,
+                lambda url=url: _request(client, url),
+            )
+            failures.extend(endpoint_failures)
+            if not result[items_key]:
+                empty.append(f"GET {url}")
+
+    db.session.rollback()
+
+    if seed:
+        failures.extend(f"{name}: no rows to check" for name in empty)
+    if failures:
+        raise click.ClickException(
+            "Failed checks:\n"
+            + "\n".join(f"  {failure}" for failure in failures)
+        )
+    click.echo(
+        f"All {len(HOT_QUERIES)} queries and {len(HOT_ENDPOINTS)} endpoints "
+        "use an index and execute a fixed number of statements."
+    )
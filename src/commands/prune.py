@@ -0,0 +1,35 @@
+"""
+A command to prune the log of changes to notes.
+
+Usage: `flask prune-note-changes [--days DAYS]`
+
+The log only needs to cover how long clients stay open without syncing;
+clients with older cursors reload all their notes instead. Run this
+periodically (such as with a daily cron job).
+"""
+
+# =============================================================================
+
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+import backend
+
+# =============================================================================
+
+
+@click.command("prune-note-changes")
+@click.option(
+    "--days",
+    default=7,
+    show_default=True,
+    help="Keep the changes from this many days.",
+)
+@with_appcontext
+def command(days):
+    """Delete old changes from the log of changes to notes."""
+    before = datetime.utcnow() - timedelta(days=days)
+    num_pruned = backend.note.prune_changes(before)
+    click.echo(f"Pruned {num_pruned} changes from before {before}")
@@ -0,0 +1,80 @@
+"""
+A command to render the HTML of existing notes.
+
+Usage: `flask render-notes [OPTIONS]` (see `flask render-notes --help`)
+
+New notes are rendered when they are sent, so this only needs to be run
+for notes sent before the HTML was stored, or after the renderer version
+changes. Notes whose HTML is missing or out of date are still rendered
+when they are shown, but aren't stored, so run this after deploying.
+"""
+
+# =============================================================================
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_, select, update
+
+from backend._markdown import RENDERER_VERSION, render_markdown
+from backend.models import Note, db
+
+# =============================================================================
+
+
+def render_notes(batch_size=500, render_all=False):
+    """Renders and stores the HTML of the notes that need it, committing
+    after each batch. Returns the number of notes that were rendered.
+    """
+    stmt = select(Note.id, Note.text).order_by(Note.id).limit(batch_size)
+    if not render_all:
+        stmt = stmt.where(
+            or_(
+                Note.html_version.is_(None),
+                Note.html_version != RENDERER_VERSION,
+            )
+        )
+
+    num_rendered = 0
+    last_id = None
+    while True:
+        batch_stmt = stmt
+        if last_id is not None:
+            batch_stmt = batch_stmt.where(Note.id > last_id)
+        rows = db.session.execute(batch_stmt).all()
+        if len(rows) == 0:
+            break
+        db.session.execute(
+            update(Note),
+            [
+                {
+                    "id": note_id,
+                    "html": render_markdown(text),
+                    "html_version": RENDERER_VERSION,
+                }
+                for note_id, text in rows
+            ],
+        )
+        db.session.commit()
+        num_rendered += len(rows)
+        last_id = rows[-1][0]
+    return num_rendered
+
+
+# =============================================================================
+
+
+@click.command("render-notes")
+@click.option("--batch-size", default=500, show_default=True)
+@click.option(
+    "--all",
+    "render_all",
+    is_flag=True,
+    help="Render all notes, even ones that are up to date.",
+)
+@with_appcontext
+def command(batch_size, render_all):
+    """Render and store the HTML of existing notes."""
+    num_rendered = render_notes(batch_size, render_all)
+    click.echo(
+        f"Rendered {num_rendered} notes (renderer version {RENDERER_VERSION})"
+    )
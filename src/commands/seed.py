@@ -0,0 +1,326 @@
+"""
+A command to seed the database with synthetic data.
+
+Usage: `flask seed [OPTIONS]` (see `flask seed --help`)
+
+The first few users are "power users", who have many more friends,
+notes, and drafts than everyone else. Rows are inserted in bulk without
+going through the model validation (or the caches), so this should only
+be used on a local database.
+"""
+
+# =============================================================================
+
+import random
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select, update
+
+import backend
+from backend._markdown import RENDERER_VERSION, render_markdown
+from backend.models import (
+    DeletedNote,
+    DraftNote,
+    FavoriteNote,
+    FriendNickname,
+    FriendRequest,
+    Friendship,
+    Note,
+    NoteChange,
+    User,
+    db,
+)
+
+# =============================================================================
+
+USERNAME_PREFIX = "seed_"
+
+# Number of rows to insert per statement
+CHUNK_SIZE = 5000
+
+# Notes are sent at random times within this window
+NOTES_TIME_WINDOW = timedelta(days=365)
+
+WORDS = (
+    "hello",
+    "good",
+    "morning",
+    "night",
+    "miss",
+    "you",
+    "today",
+    "was",
+    "fun",
+    "**great**",
+    "_really_",
+    ":smile:",
+    ":heart:",
+    "see",
+    "soon",
+)
+
+# =============================================================================
+
+
+def _insert_all(model, rows):
+    """Inserts the given rows in chunks."""
+    for i in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[i : i + CHUNK_SIZE])
+
+
+def _random_text(rng, num_words):
+    return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+
+def clear_database():
+    """Deletes all rows from all tables, and clears the caches."""
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+    backend.friend.friends_cache.clear()
+
+
+def seed_database(
+    num_users=100,
+    friends_per_user=10,
+    requests_per_user=2,
+    nicknames_per_user=2,
+    drafts_per_user=2,
+    notes_per_user=20,
+    changes_per_user=20,
+    favorite_fraction=0.1,
+    deleted_fraction=0.05,
+    num_power_users=1,
+    power_factor=50,
+    random_seed=0,
+):  # pylint: disable=too-many-arguments,too-many-locals
+    """Seeds the database with synthetic data, and returns the ids of the
+    created users (with the power users first).
+
+    Power users have `power_factor` times as many friends, friend requests
+    (both sent and received), notes, and drafts as everyone else.
+    """
+    rng = random.Random(random_seed)
+
+    # Pick a username prefix that isn't used yet so that seeding can be
+    # repeated on the same database
+    prefix = USERNAME_PREFIX
+    attempt = 0
+    while db.session.scalars(
+        select(User.id).where(User.username.startswith(prefix)).limit(1)
+    ).first():
+        attempt += 1
+        prefix = f"{USERNAME_PREFIX}{attempt}_"
+
+    _insert_all(
+        User,
+        [
+            {
+                "email": f"{prefix}{i}@example.com",
+                "username": f"{prefix}{i}",
+                "display_name": f"Seed User {i}",
+                "is_admin": False,
+                "is_deleted": False,
+            }
+            for i in range(num_users)
+        ],
+    )
+    ids_by_username = dict(
+        db.session.execute(
+            select(User.username, User.id).where(
+                User.username.startswith(prefix)
+            )
+        ).all()
+    )
+    user_ids = [ids_by_username[f"{prefix}{i}"] for i in range(num_users)]
+
+    def scaled(index, count):
+        if index < num_power_users:
+            count *= power_factor
+        return count
+
+    # Friendships
+    friends = {user_id: set() for user_id in user_ids}
+    for index, user_id in enumerate(user_ids):
+        num_friends = min(scaled(index, friends_per_user), num_users - 1)
+        while len(friends[user_id]) < num_friends:
+            friend_id = rng.choice(user_ids)
+            if friend_id == user_id:
+                continue
+            friends[user_id].add(friend_id)
+            friends[friend_id].add(user_id)
+    _insert_all(
+        Friendship,
+        [
+            {"user1_id": user_id, "user2_id": friend_id}
+            for user_id, friend_ids in friends.items()
+            for friend_id in friend_ids
+            if user_id < friend_id
+        ],
+    )
+
+    # Friend requests (between users who aren't friends yet)
+    friend_requests = set()
+
+    def add_request(sender_id, recipient_id):
+        if (
+            recipient_id == sender_id
+            or recipient_id in friends[sender_id]
+            or (recipient_id, sender_id) in friend_requests
+        ):
+            return
+        friend_requests.add((sender_id, recipient_id))
+
+    for index, user_id in enumerate(user_ids):
+        for _ in range(scaled(index, requests_per_user)):
+            add_request(user_id, rng.choice(user_ids))
+        if index < num_power_users:
+            for _ in range(scaled(index, requests_per_user)):
+                add_request(rng.choice(user_ids), user_id)
+    _insert_all(
+        FriendRequest,
+        [
+            {"sender_id": sender_id, "recipient_id": recipient_id}
+            for sender_id, recipient_id in friend_requests
+        ],
+    )
+
+    # Nicknames
+    nickname_rows = []
+    for user_id in user_ids:
+        num_nicknames = min(nicknames_per_user, len(friends[user_id]))
+        for friend_id in rng.sample(sorted(friends[user_id]), num_nicknames):
+            nickname_rows.append(
+                {
+                    "user_id": user_id,
+                    "friend_id": friend_id,
+                    "nickname": _random_text(rng, 2),
+                }
+            )
+    _insert_all(FriendNickname, nickname_rows)
+
+    # Drafts
+    draft_rows = []
+    for index, user_id in enumerate(user_ids):
+        for _ in range(scaled(index, drafts_per_user)):
+            recipient_id = None
+            if friends[user_id] and rng.random() < 0.8:
+                recipient_id = rng.choice(sorted(friends[user_id]))
+            draft_rows.append(
+                {
+                    "user_id": user_id,
+                    "recipient_id": recipient_id,
+                    "text": _random_text(rng, rng.randint(0, 50)),
+                }
+            )
+    _insert_all(DraftNote, draft_rows)
+
+    # Notes
+    now = datetime.utcnow()
+    note_rows = []
+    for index, user_id in enumerate(user_ids):
+        if not friends[user_id]:
+            continue
+        friend_ids = sorted(friends[user_id])
+        for _ in range(scaled(index, notes_per_user)):
+            text = _random_text(rng, rng.randint(1, 100))
+            note_rows.append(
+                {
+                    "sender_id": user_id,
+                    "recipient_id": rng.choice(friend_ids),
+                    "text": text,
+                    "time_sent": now - NOTES_TIME_WINDOW * rng.random(),
+                    # Like `backend.note.send()`
+                    "html": render_markdown(text),
+                    "html_version": RENDERER_VERSION,
+                }
+            )
+    _insert_all(Note, note_rows)
+
+    # Favorites and deletions (by either the sender or the recipient)
+    favorite_rows = []
+    deleted_rows = []
+    notes = db.session.execute(
+        select(Note.id, Note.sender_id, Note.recipient_id).where(
+            Note.sender_id.in_(user_ids)
+        )
+    ).all()
+    for note_id, sender_id, recipient_id in notes:
+        for user_id in (sender_id, recipient_id):
+            if rng.random() < favorite_fraction:
+                favorite_rows.append({"user_id": user_id, "note_id": note_id})
+            if rng.random() < deleted_fraction:
+                deleted_rows.append({"user_id": user_id, "note_id": note_id})
+    _insert_all(FavoriteNote, favorite_rows)
+    _insert_all(DeletedNote, deleted_rows)
+
+    # Changes to the latest notes of each user, each in its own data version
+    # (like `backend.note.send()`)
+    note_ids_by_user = {user_id: [] for user_id in user_ids}
+    for note_id, sender_id, recipient_id in notes:
+        note_ids_by_user[sender_id].append(note_id)
+        note_ids_by_user[recipient_id].append(note_id)
+    change_rows = []
+    data_versions = []
+    for user_id, note_ids in note_ids_by_user.items():
+        latest_ids = sorted(note_ids)[-changes_per_user:]
+        if len(latest_ids) == 0:
+            continue
+        for version, note_id in enumerate(latest_ids, 1):
+            change_rows.append(
+                {
+                    "user_id": user_id,
+                    "note_id": note_id,
+                    "version": version,
+                    "time": now,
+                }
+            )
+        data_versions.append({"id": user_id, "data_version": len(latest_ids)})
+    _insert_all(NoteChange, change_rows)
+    if len(data_versions) > 0:
+        db.session.execute(update(User), data_versions)
+
+    db.session.commit()
+    return user_ids
+
+
+# =============================================================================
+
+
+@click.command("seed")
+@click.option("--users", "num_users", default=100, show_default=True)
+@click.option("--friends", "friends_per_user", default=10, show_default=True)
+@click.option("--requests", "requests_per_user", default=2, show_default=True)
+@click.option(
+    "--nicknames", "nicknames_per_user", default=2, show_default=True
+)
+@click.option("--drafts", "drafts_per_user", default=2, show_default=True)
+@click.option("--notes", "notes_per_user", default=20, show_default=True)
+@click.option("--changes", "changes_per_user", default=20, show_default=True)
+@click.option("--favorite-fraction", default=0.1, show_default=True)
+@click.option("--deleted-fraction", default=0.05, show_default=True)
+@click.option("--power-users", "num_power_users", default=1, show_default=True)
+@click.option(
+    "--power-factor",
+    default=50,
+    show_default=True,
+    help="How many times more data the power users have.",
+)
+@click.option("--random-seed", default=0, show_default=True)
+@click.option("--clear", is_flag=True, help="Delete all existing data first.")
+@click.confirmation_option(
+    prompt="This will write synthetic data into the configured database. "
+    "Continue?"
+)
+@with_appcontext
+def command(clear, **kwargs):
+    """Seed the database with synthetic users, friends, and notes."""
+    if clear:
+        clear_database()
+    user_ids = seed_database(**kwargs)
+    click.echo(f"Created {len(user_ids)} users")
+    if kwargs["num_power_users"] > 0:
+        power_user_ids = user_ids[: kwargs["num_power_users"]]
+        click.echo(f"Power user ids: {power_user_ids}")
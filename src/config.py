@@ -32,6 +32,65 @@ class Config:
     # Attempt to re-establish closed connections due to server restarts
     # (which Render does in free tier web services)
     SQLALCHEMY_ENGINE_OPTIONS = {"pool_pre_ping": True}
+    # The number of worker threads for regular requests, on top of those for
+    # event streams (see `start.sh`). Event streams don't hold a database
+    # connection while they wait, so the connection pool allows one for each
+    # of these threads (except with SQLite, which has its own pools).
+    REQUEST_THREADS = int(os.getenv("REQUEST_THREADS", "50"))
+    # How many of those connections are kept open when idle
+    DB_POOL_SIZE = 10
+
+    # Whether to send a `Server-Timing` header with the database, template,
+    # and total times of each request
+    SERVER_TIMING = True
+    # Log any database statement that takes at least this many milliseconds
+    # (None to disable)
+    SLOW_QUERY_THRESHOLD_MS = 250
+
+    # Cache the ids of each user's friends in each worker
+    FRIENDS_CACHE_ENABLED = True
+    # The maximum number of users whose friends are cached
+    FRIENDS_CACHE_MAX_USERS = 10000
+    # How long a user's cached friends are used for (None for forever)
+    FRIENDS_CACHE_TTL_SECONDS = 300
+    # Cache the data version of each user in each worker (used as the ETag of
+    # list responses). Keep the TTL short unless the invalidation bus can
+    # notify the other workers.
+    DATA_VERSIONS_CACHE_ENABLED = True
+    DATA_VERSIONS_CACHE_MAX_USERS = 10000
+    DATA_VERSIONS_CACHE_TTL_SECONDS = 60
+    # Send cache invalidations to the other workers through Postgres
+    # LISTEN/NOTIFY (ignored for other databases)
+    INVALIDATION_BUS_NOTIFY = True
+
+    # Push events to clients as they happen through `/api/stream`
+    # (server-sent events). Each open stream holds a worker thread, so run
+    # gunicorn with enough threads (see `start.sh`).
+    STREAM_ENABLED = True
+    # The maximum number of open streams in each worker (more clients fall
+    # back to polling)
+    STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "500"))
+    # How often to send a comment on idle streams, so that proxies don't
+    # close them and closed connections are noticed
+    STREAM_HEARTBEAT_SECONDS = 25
+    # How long a stream stays open before the client has to reconnect, so
+    # that clients spread out over workers and deployments
+    STREAM_MAX_SECONDS = 30 * 60
+
+    # Compress responses with these types (with Brotli or gzip), unless they
+    # are smaller than the minimum size
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIMETYPES = (
+        "text/html",
+        "text/css",
+        "text/javascript",
+        "application/javascript",
+        "application/json",
+    )
+    COMPRESSION_MIN_BYTES = 1024
+    # Compression levels, trading CPU time for smaller responses
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
 
 
 class ProdConfig(Config):
@@ -55,6 +55,23 @@ function ajaxRequest(method, url, options = {}) {
   $.ajax({ method, url, ...options });
 }
 
+/**
+ * Opens a stream of server-sent events, calling the handler for each event
+ * name whenever that event is received. The browser reconnects on its own if
+ * the connection is lost.
+ *
+ * Returns the `EventSource`, or null if the browser doesn't support them (in
+ * which case the page should keep polling).
+ */
+function openEventStream(url, handlers) {
+  if (!window.EventSource) return null;
+  const source = new EventSource(url);
+  for (const [eventName, handler] of Object.entries(handlers)) {
+    source.addEventListener(eventName, () => handler());
+  }
+  return source;
+}
+
 /******************************************************************************
  * Bootstrap                                                                  *
  ******************************************************************************/
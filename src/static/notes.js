@@ -84,24 +84,25 @@ function initNoteCards($element, noNotesText, response, $error = null) {
   if (response.numNotes === 0) {
     $element.html("");
     $element.append(
-      $("<div>", { class: "d-flex justify-content-center mt-3" }).append(
-        $("<span>", { class: "fst-italic" }).text(noNotesText)
-      )
+      $("<div>", {
+        class: "no-notes-message d-flex justify-content-center mt-3",
+      }).append($("<span>", { class: "fst-italic" }).text(noNotesText))
     );
-    return;
+    return $();
   }
 
-  $element.html(response.notesHtml);
+  $element.html("");
 
-  // Handle favoriting
-  $element.find(".note-favorite-btn").on("click", function (event) {
+  // Handle favoriting (delegated so that later pages are handled too)
+  $element.on("click", ".note-favorite-btn", function (event) {
     const $btn = $(this);
     const noteId = $btn.attr("note-id");
     if (noteId == null) return;
+    const $card = $(`#note-${noteId}-card`);
+    const method = $card.attr("is-favorite") == null ? "PUT" : "DELETE";
     $error?.html("");
-    ajaxRequest("POST", "/api/notes/favorites", {
-      contentType: "application/json",
-      data: JSON.stringify({ noteId }),
+    // Idempotent, so a double click can't undo itself
+    ajaxRequest(method, `/api/notes/${noteId}/favorite`, {
       success: (response, status, jqXHR) => {
         if (!response.success) {
           $error?.append(bsErrorAlert(response.error, { class: "mt-3" }));
@@ -110,17 +111,34 @@ function initNoteCards($element, noNotesText, response, $error = null) {
         let iconCode = "heart";
         if (response.isFavorite) {
           iconCode += "-fill";
-          $(`#note-${noteId}-card`).attr("is-favorite", "true");
+          $card.attr("is-favorite", "true");
         } else {
-          $(`#note-${noteId}-card`).removeAttr("is-favorite");
+          $card.removeAttr("is-favorite");
         }
         $btn.html(bsIcon(iconCode));
       },
     });
   });
 
+  return appendNoteCards($element, response);
+}
+
+/**
+ * Adds a page of note cards to the given element (before the "load more"
+ * sentinel, if there is one). Returns the new cards.
+ */
+function appendNoteCards($element, response) {
+  const $nodes = $($.parseHTML(response.notesHtml));
+  const $sentinel = $element.children(".load-more-sentinel");
+  if ($sentinel.length > 0) {
+    $sentinel.before($nodes);
+  } else {
+    $element.append($nodes);
+  }
+  const $cards = $nodes.filter(".card");
+
   // Convert content
-  $element.find(".card-body[not-converted]").forEach(($element) => {
+  $cards.find(".card-body[not-converted]").forEach(($element) => {
     let content = $element.html();
     if (!content.trim()) {
       content = "_Nothing to see yet :eyes:_";
@@ -130,11 +148,253 @@ function initNoteCards($element, noNotesText, response, $error = null) {
   });
 
   refreshTimestampTooltips();
+
+  return $cards;
+}
+
+/**
+ * Fetches the next page of notes from the given URL whenever the bottom of the
+ * given element scrolls into view, until there are no more pages.
+ *
+ * `onPage` is called with the new cards after each page is added.
+ */
+function loadMoreNoteCards(
+  $element,
+  url,
+  nextCursor,
+  { $error = null, onPage = null } = {}
+) {
+  if (nextCursor == null) return;
+
+  const $sentinel = $("<div>", {
+    class: "load-more-sentinel d-flex justify-content-center my-3",
+  }).append(
+    $("<div>", {
+      class: "spinner-border spinner-border-sm text-secondary",
+      role: "status",
+    })
+  );
+  $element.append($sentinel);
+  const sentinel = $sentinel.get(0);
+
+  let loading = false;
+  const observer = new IntersectionObserver((entries) => {
+    if (loading) return;
+    if (!entries.some((entry) => entry.isIntersecting)) return;
+    loading = true;
+    const pageUrl = new URL(url, window.location.origin);
+    pageUrl.searchParams.set("before", nextCursor);
+    ajaxRequest("GET", pageUrl.toString(), {
+      success: (response, status, jqXHR) => {
+        loading = false;
+        if (!response.success) {
+          observer.disconnect();
+          $sentinel.remove();
+          $error?.append(bsErrorAlert(response.error, { class: "mt-3" }));
+          return;
+        }
+        onPage?.(appendNoteCards($element, response));
+        nextCursor = response.nextCursor;
+        if (nextCursor == null) {
+          observer.disconnect();
+          $sentinel.remove();
+          return;
+        }
+        // Re-observe so that the next page is fetched if the sentinel is
+        // still in view
+        observer.unobserve(sentinel);
+        observer.observe(sentinel);
+      },
+    });
+  });
+  observer.observe(sentinel);
+}
+
+/**
+ * Applies a response from the note changes API to the note cards in the given
+ * element: removed notes are removed, changed notes are replaced, and new
+ * notes are inserted in order (unless they belong on a page that hasn't been
+ * loaded yet). Returns the new and replaced cards.
+ */
+function applyNoteChanges($element, response) {
+  for (const noteId of response.removedIds) {
+    $(`#note-${noteId}-card`).remove();
+  }
+
+  const $cards = $($.parseHTML(response.notesHtml)).filter(".card");
+  $cards.forEach(($card) => {
+    const $existing = $(`#${$card.attr("id")}`);
+    if ($existing.length > 0) {
+      $existing.replaceWith($card);
+      return;
+    }
+    // Cards are sorted by most recently sent
+    const timeSent = $card.attr("time-sent");
+    const $next = $element
+      .children(".card[time-sent]")
+      .filter((index, card) => $(card).attr("time-sent") < timeSent)
+      .first();
+    if ($next.length > 0) {
+      $next.before($card);
+    } else if ($element.children(".load-more-sentinel").length === 0) {
+      $element.append($card);
+    }
+  });
+
+  refreshTimestampTooltips();
+
+  return $cards;
+}
+
+/**
+ * Returns a function that fetches the changes to the notes since the given
+ * cursor from the given URL, and applies them to the note cards in the given
+ * element.
+ *
+ * `onCards` is called with the new and replaced cards after each sync.
+ */
+function syncNoteChanges(
+  $element,
+  url,
+  cursor,
+  { $error = null, onCards = null } = {}
+) {
+  let syncing = false;
+  let syncAgain = false;
+
+  function sync() {
+    if (cursor == null) return;
+    if (syncing) {
+      // Sync again afterwards in case this was called for a newer change
+      syncAgain = true;
+      return;
+    }
+    syncing = true;
+    const changesUrl = new URL(url, window.location.origin);
+    changesUrl.searchParams.set("since", cursor);
+    ajaxRequest("GET", changesUrl.toString(), {
+      success: (response, status, jqXHR) => {
+        if (!response.success) {
+          cursor = null;
+          $error?.append(bsErrorAlert(response.error, { class: "mt-3" }));
+          return;
+        }
+        if (
+          response.reset ||
+          // The modals weren't included if there were no notes
+          (response.numNotes > 0 &&
+            $element.children(".no-notes-message").length > 0)
+        ) {
+          window.location.reload();
+          return;
+        }
+        cursor = response.cursor;
+        onCards?.(applyNoteChanges($element, response));
+      },
+      complete: () => {
+        syncing = false;
+        if (syncAgain) {
+          syncAgain = false;
+          sync();
+        }
+      },
+    });
+  }
+
+  return sync;
+}
+
+/**
+ * Adds a "Select" button to the given toolbar, which lets the user select
+ * multiple note cards in the given element and act on all of them at once.
+ *
+ * Each action is `{ label, url, btnClass }`: the ids of the selected notes are
+ * posted to its URL, then `onSuccess` is called with the response.
+ */
+function initNoteSelection(
+  $element,
+  $toolbar,
+  actions,
+  { $error = null, onSuccess = null } = {}
+) {
+  function getSelectedIds() {
+    return $element
+      .find(".note-select:checked")
+      .map((index, checkbox) => Number($(checkbox).attr("note-id")))
+      .get();
+  }
+
+  const $selectBtn = $("<button>", {
+    class: "btn btn-sm btn-outline-secondary rounded-pill",
+  }).text("Select");
+  const $count = $("<span>", { class: "me-1", style: "font-size: 0.9em;" });
+  const $actions = $("<span>", { class: "d-none" }).append($count);
+
+  function updateSelected() {
+    const numSelected = getSelectedIds().length;
+    $count.text(`${numSelected} selected`);
+    $actions.find("[bulk-action]").prop("disabled", numSelected === 0);
+  }
+
+  function stopSelecting() {
+    $element.removeClass("selecting");
+    $element.find(".note-select").prop("checked", false);
+    $actions.addClass("d-none");
+    $selectBtn.removeClass("d-none");
+  }
+
+  $selectBtn.on("click", function (event) {
+    $element.addClass("selecting");
+    $selectBtn.addClass("d-none");
+    $actions.removeClass("d-none");
+    updateSelected();
+  });
+  for (const { label, url, btnClass = "btn-outline-secondary" } of actions) {
+    $actions.append(
+      $("<button>", {
+        class: `btn btn-sm ${btnClass} rounded-pill ms-1`,
+        "bulk-action": label,
+      })
+        .text(label)
+        .on("click", function (event) {
+          const noteIds = getSelectedIds();
+          if (noteIds.length === 0) return;
+          $error?.html("");
+          ajaxRequest("POST", url, {
+            contentType: "application/json",
+            data: JSON.stringify({ noteIds }),
+            success: (response, status, jqXHR) => {
+              if (!response.success) {
+                $error?.append(bsErrorAlert(response.error, { class: "mt-3" }));
+                return;
+              }
+              stopSelecting();
+              onSuccess?.(response);
+            },
+          });
+        })
+    );
+  }
+  $actions.append(
+    $("<button>", { class: "btn btn-sm btn-link" })
+      .text("Cancel")
+      .on("click", stopSelecting)
+  );
+  $element.on("change", ".note-select", updateSelected);
+
+  $toolbar.append($selectBtn, $actions);
 }
 
 function sendAjaxOnClick(
   $elements,
-  { method, buildUrlFunc, $error, buildOptionsFunc = null, onError = null }
+  {
+    method,
+    buildUrlFunc,
+    $error,
+    buildOptionsFunc = null,
+    onError = null,
+    onSuccess = null,
+  }
 ) {
   $elements.on("click", function (event) {
     $error.html("");
@@ -153,6 +413,10 @@ function sendAjaxOnClick(
           $error.append(bsErrorAlert(response.error, { class: "mt-3" }));
           return;
         }
+        if (onSuccess != null) {
+          onSuccess(response, noteId);
+          return;
+        }
         // Refresh page on success
         window.location.reload();
       },
@@ -169,11 +433,20 @@ function initModalActionButton(modalId, ajaxOptions) {
   });
 
   // Set up button handler
+  const closeModal = () => $(`#${modalId}-close`).trigger("click");
+  const { onSuccess = null } = ajaxOptions;
   sendAjaxOnClick($(`#${modalId}-btn`), {
     ...ajaxOptions,
     onError: () => {
       // Close the modal before showing error
-      $(`#${modalId}-close`).trigger("click");
+      closeModal();
     },
+    onSuccess:
+      onSuccess == null
+        ? null
+        : (response, noteId) => {
+            closeModal();
+            onSuccess(response, noteId);
+          },
   });
 }
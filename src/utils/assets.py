@@ -0,0 +1,152 @@
+"""
+Utilities for serving the static assets (such as `global.js`).
+
+`flask build-assets` (see `commands.assets`) copies each asset to a file
+whose name includes a hash of its content, along with precompressed
+variants, and writes a manifest of them. Since a fingerprinted file never
+changes, it is served with a long-lived immutable cache header, and the
+browser doesn't request it again until the asset changes.
+
+Templates link to assets with `asset_url_for()`, which is used like
+`url_for("static", filename=...)`. If the assets haven't been built (such
+as in development), the original files are linked instead.
+"""
+
+# =============================================================================
+
+import hashlib
+import json
+import mimetypes
+from typing import Dict, List, Optional
+
+from flask import abort, request, send_file, url_for
+
+from utils import STATIC_FOLDER
+
+# =============================================================================
+
+__all__ = (
+    "DIST_FOLDER",
+    "MANIFEST_FILE",
+    "ASSET_SUFFIXES",
+    "ENCODINGS",
+    "asset_url_for",
+    "get_manifest_hash",
+    "init_app",
+)
+
+# =============================================================================
+
+DIST_FOLDER = STATIC_FOLDER / "dist"
+MANIFEST_FILE = DIST_FOLDER / "manifest.json"
+
+# The static files that are built as assets
+ASSET_SUFFIXES = (".js", ".css")
+
+# The precompressed variants of each asset, as (encoding, file suffix), in
+# order of preference
+ENCODINGS = (
+    ("br", ".br"),
+    ("gzip", ".gz"),
+)
+
+# A year, which is the longest that browsers cache for
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# =============================================================================
+
+# The built asset of each original filename
+_fingerprinted: Dict[str, str] = {}
+# The original filename and precompressed encodings of each built asset
+_built: Dict[str, Dict] = {}
+# A hash of the loaded manifest, which changes whenever the assets do
+_manifest_hash = ""
+
+# =============================================================================
+
+
+def asset_url_for(endpoint: str, **values) -> str:
+    """Returns the url of the built asset for a static file, or the same
+    url as `url_for()` for anything else.
+    """
+    if endpoint == "static":
+        fingerprinted = _fingerprinted.get(values.get("filename"), None)
+        if fingerprinted is not None:
+            values["filename"] = fingerprinted
+            return url_for("serve_asset", **values)
+    return url_for(endpoint, **values)
+
+
+def _choose_encoding(encodings: List[str]) -> Optional[str]:
+    """Returns the most preferred of the given encodings that the client
+    accepts, or None if it accepts none of them.
+    """
+    for encoding, _ in ENCODINGS:
+        if encoding in encodings and request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def get_manifest_hash() -> str:
+    """Returns a hash of the built assets, or an empty string if they
+    haven't been built.
+
+    Pages that link to assets can include it in their ETags, since the
+    urls of the assets change whenever they are built again.
+    """
+    return _manifest_hash
+
+
+def serve_asset(filename):
+    """Serves a built asset, precompressed if the client accepts it."""
+    asset = _built.get(filename, None)
+    if asset is None:
+        abort(404)
+
+    encoding = _choose_encoding(asset["encodings"])
+    path = DIST_FOLDER / filename
+    if encoding is not None:
+        path = path.with_name(path.name + dict(ENCODINGS)[encoding])
+    # The type of the original file, rather than of the compressed one
+    mimetype, _ = mimetypes.guess_type(asset["original"])
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    # Otherwise it names the compressed file
+    response.headers.pop("Content-Disposition", None)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# =============================================================================
+
+
+def _load_manifest():
+    global _manifest_hash  # pylint: disable=global-statement
+
+    if not MANIFEST_FILE.exists():
+        return
+    content = MANIFEST_FILE.read_bytes()
+    _manifest_hash = hashlib.sha256(content).hexdigest()[:16]
+    manifest = json.loads(content)
+    for original, asset in manifest.items():
+        _fingerprinted[original] = asset["file"]
+        _built[asset["file"]] = {
+            "original": original,
+            "encodings": asset["encodings"],
+        }
+
+
+def init_app(app):
+    """Sets up serving the built assets for the app."""
+    _load_manifest()
+    if not _built:
+        app.logger.info(
+            "Assets are served without fingerprints, since they haven't "
+            "been built (see `flask build-assets`)"
+        )
+    app.add_url_rule(
+        "/assets/<path:filename>", "serve_asset", serve_asset, methods=["GET"]
+    )
+    app.add_template_global(asset_url_for)
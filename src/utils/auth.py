@@ -7,7 +7,7 @@ Utilities for authentication and authorization.
 import functools
 from typing import Dict, Optional
 
-from flask import redirect, request, session, url_for
+from flask import g, redirect, request, session, url_for
 from werkzeug.exceptions import Forbidden
 
 import backend
@@ -54,6 +54,7 @@ def set_logged_in_user(user: backend.models.User):
         "display_name": user.display_name,
         "is_admin": user.is_admin,
     }
+    g.session_user = (user.email, session["user"])
 
 
 def get_email() -> Optional[str]:
@@ -65,9 +66,21 @@ def get_logged_in_user() -> Optional[Dict]:
     """Gets the currently logged in user, or None if no one is logged
     in (or the user hasn't been created yet).
 
-    The returned user is a dictionary containing values for a user.
+    The returned user is a dictionary containing values for a user. It
+    is only looked up once per request (unless the email changes).
     """
     email = get_email()
+    # The email that the user was looked up for, and the user
+    cached = g.get("session_user", None)
+    if cached is not None and cached[0] == email:
+        return cached[1]
+
+    session_user = _get_session_user(email)
+    g.session_user = (email, session_user)
+    return session_user
+
+
+def _get_session_user(email: Optional[str]) -> Optional[Dict]:
     session_user = session.get("user", None)
     if session_user is None or session_user["email"] != email:
         if email is None:
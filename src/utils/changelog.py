@@ -1,10 +1,16 @@
 """
 Utilities for the changelog file.
+
+The file is loaded once and kept in memory, and is only loaded again when
+its modification time changes (such as after a deployment).
 """
 
 # =============================================================================
 
+import hashlib
 import json
+import threading
+from typing import Callable, Dict, List, Optional
 
 from utils import STATIC_FOLDER
 
@@ -17,23 +23,87 @@ TIMESTAMP_FMT = "%Y-%m-%d %H:%M"
 # =============================================================================
 
 
-def _read():
-    if not CHANGELOG_FILE.exists():
-        return []
-    changes = json.loads(CHANGELOG_FILE.read_bytes())
-    for change in changes:
-        version_parts = change["version"].split(".")
-        change["version_tuple"] = tuple(map(int, version_parts))
-    return sorted(changes, key=lambda c: c["version_tuple"], reverse=True)
+class _Changelog:
+    """A loaded version of the changelog file."""
+
+    def __init__(self, mtime_ns: Optional[int], content: bytes):
+        self.mtime_ns = mtime_ns
+        self.content_hash = hashlib.sha256(content).hexdigest()[:16]
+
+        changes = json.loads(content) if len(content) > 0 else []
+        for change in changes:
+            version_parts = change["version"].split(".")
+            change["version_tuple"] = tuple(map(int, version_parts))
+        changes.sort(key=lambda c: c["version_tuple"], reverse=True)
+        self.changes = changes
+
+        if len(changes) == 0:
+            self.latest_version = ""
+        else:
+            self.latest_version = f"v{changes[0]['version']}"
+
+        # The rendered changes, once a request renders them
+        self.html = None
+
+
+_changelog: Optional[_Changelog] = None
+_changelog_lock = threading.Lock()
+
+# =============================================================================
+
+
+def _get_mtime_ns() -> Optional[int]:
+    try:
+        return CHANGELOG_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _get() -> _Changelog:
+    """Returns the loaded changelog, loading it again if the file has
+    changed since.
+    """
+    global _changelog  # pylint: disable=global-statement
+
+    mtime_ns = _get_mtime_ns()
+    changelog = _changelog
+    if changelog is not None and changelog.mtime_ns == mtime_ns:
+        return changelog
+    with _changelog_lock:
+        if _changelog is None or _changelog.mtime_ns != mtime_ns:
+            try:
+                content = CHANGELOG_FILE.read_bytes()
+            except FileNotFoundError:
+                content = b""
+            _changelog = _Changelog(mtime_ns, content)
+        return _changelog
+
+
+def read_changelog() -> List[Dict]:
+    """Returns the changes, newest first. The list is shared, so it must
+    not be modified.
+    """
+    return _get().changes
+
+
+def get_latest_version() -> str:
+    return _get().latest_version
+
+
+def get_content_hash() -> str:
+    """Returns a hash of the changelog file's content."""
+    return _get().content_hash
 
 
-def read_changelog():
-    return _read()
+def render_changelog(render: Callable[[List[Dict]], str]) -> str:
+    """Returns the changes rendered as HTML by the given function, which
+    is only called once for each version of the file.
+    """
+    changelog = _get()
+    if changelog.html is None:
+        changelog.html = render(changelog.changes)
+    return changelog.html
 
 
-def get_latest_version():
-    changes = _read()
-    if len(changes) == 0:
-        return ""
-    latest_version = changes[0]["version"]
-    return f"v{latest_version}"
+# Load the file at startup
+_get()
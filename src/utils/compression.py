@@ -0,0 +1,165 @@
+"""
+Utilities for compressing responses.
+
+Responses with a compressible type (such as the rendered notes in list
+responses) are compressed with Brotli or gzip, whichever the client
+prefers. Development environments without the `brotli` package (which
+is a dependency) fall back to gzip only.
+Streamed responses are compressed chunk by chunk, and each chunk is
+flushed so that it reaches the client right away.
+
+See the `COMPRESSION_*` settings in `config.Config`.
+"""
+
+# =============================================================================
+
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# =============================================================================
+
+__all__ = (
+    "get_encodings",
+    "init_app",
+)
+
+# =============================================================================
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        # Add a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + 15)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT, quality=quality
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+# =============================================================================
+
+
+def get_encodings():
+    """Returns the supported encodings, in order of preference."""
+    if brotli is None:
+        return ("gzip",)
+    return ("br", "gzip")
+
+
+def _choose_encoding() -> Optional[str]:
+    """Returns the most preferred encoding that the client accepts, or
+    None if it accepts none of them.
+    """
+    for encoding in get_encodings():
+        if request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def _make_compressor(encoding: str):
+    config = current_app.config
+    if encoding == "br":
+        return _BrotliCompressor(config["COMPRESSION_BROTLI_QUALITY"])
+    return _GzipCompressor(config["COMPRESSION_GZIP_LEVEL"])
+
+
+def _compress_stream(
+    compressor, original: Iterable, chunks: Iterable[bytes]
+) -> Iterator[bytes]:
+    try:
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+            yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+    finally:
+        if hasattr(original, "close"):
+            original.close()
+
+
+def _is_compressible(response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if response.direct_passthrough:
+        # A file, which is served as it is (see `utils.assets`)
+        return False
+    if "Content-Encoding" in response.headers:
+        return False
+    return response.mimetype in current_app.config["COMPRESSION_MIMETYPES"]
+
+
+def _compress_response(response):
+    if not _is_compressible(response):
+        return response
+    # Whether the response is compressed depends on the request's encodings
+    response.vary.add("Accept-Encoding")
+
+    if request.method == "HEAD":
+        return response
+    # The length of a streamed response is usually unknown, so it's always
+    # compressed
+    min_bytes = current_app.config["COMPRESSION_MIN_BYTES"]
+    if (
+        response.content_length is not None
+        and response.content_length < min_bytes
+    ):
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    compressor = _make_compressor(encoding)
+    if response.is_streamed:
+        response.response = _compress_stream(
+            compressor, response.response, response.iter_encoded()
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(
+            compressor.compress(response.get_data()) + compressor.finish()
+        )
+    response.headers["Content-Encoding"] = encoding
+
+    # The compressed body is a different representation, so its ETag can
+    # only be a weak one
+    etag, is_weak = response.get_etag()
+    if etag is not None and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# =============================================================================
+
+
+def init_app(app):
+    """Sets up compressing responses for the app."""
+    if app.config["COMPRESSION_ENABLED"]:
+        app.after_request(_compress_response)
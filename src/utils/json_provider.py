@@ -0,0 +1,83 @@
+"""
+A faster JSON provider for the app.
+
+JSON is serialized and parsed with `orjson`, which is a dependency. For
+development environments without it, the stdlib `json` module is used as
+usual instead, but without sorting keys or escaping non-ASCII characters
+(which Flask does by default, and which only make responses slower and
+larger).
+"""
+
+# =============================================================================
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# =============================================================================
+
+__all__ = (
+    "FastJSONProvider",
+    "get_library",
+    "init_app",
+)
+
+# =============================================================================
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """A JSON provider that uses `orjson` if it's installed."""
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def _orjson_dumps(self, obj, indent: bool = False) -> bytes:
+        # Pass datetimes to `default()` so that they're serialized the same
+        # as with the stdlib provider
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        # `orjson` doesn't support any of the `json.dumps()` arguments
+        if orjson is None or len(kwargs) > 0:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or len(kwargs) > 0:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (
+            self.compact is None and self._app.debug
+        ) or self.compact is False
+        # Skip decoding to a string, since it would only be encoded again
+        return self._app.response_class(
+            self._orjson_dumps(obj, indent) + b"\n", mimetype=self.mimetype
+        )
+
+
+# =============================================================================
+
+
+def get_library() -> str:
+    """Returns the name of the library that JSON is serialized with."""
+    if orjson is None:
+        return "json"
+    return "orjson"
+
+
+def init_app(app):
+    """Sets up the JSON provider for the app."""
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,177 @@
+"""
+Utilities for logging in with an OpenID Connect provider (Google).
+
+The provider's discovery document and signing keys (JWKS) are cached for
+as long as its `Cache-Control` headers allow, and all requests go through
+one pooled keep-alive session. The `id_token` returned by the token
+endpoint is verified locally (with PyJWT) against the cached keys, so the
+user's info doesn't need to be fetched separately.
+"""
+
+# =============================================================================
+
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import jwt
+import requests
+from requests.adapters import HTTPAdapter
+
+# =============================================================================
+
+__all__ = (
+    "InvalidIdTokenError",
+    "http",
+    "get_provider_cfg",
+    "verify_id_token",
+)
+
+# =============================================================================
+
+# (connect, read) timeouts of requests to the provider
+REQUEST_TIMEOUT = (5, 15)
+
+# How long documents are cached for when the provider doesn't say, and the
+# bounds of what it may say
+DEFAULT_CACHE_SECONDS = 60 * 60
+MIN_CACHE_SECONDS = 60
+MAX_CACHE_SECONDS = 24 * 60 * 60
+
+# How far the clocks of the provider and this server may be apart
+CLOCK_SKEW_SECONDS = 60
+
+# The smallest RSA key that is accepted
+MIN_KEY_BITS = 2048
+
+# The claims that every `id_token` must have
+REQUIRED_CLAIMS = ["iss", "aud", "exp"]
+
+MAX_AGE_PATTERN = re.compile(r"(?:^|,)\s*max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+# =============================================================================
+
+# Requests to the provider reuse their connections
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# The cached documents, by url, along with when they expire
+_documents: Dict[str, Tuple[float, Dict]] = {}
+_documents_lock = threading.Lock()
+
+# =============================================================================
+
+
+class InvalidIdTokenError(ValueError):
+    """Raised when an `id_token` is malformed or fails verification."""
+
+
+# =============================================================================
+
+
+def _cache_seconds(headers) -> int:
+    """Returns how long a response may be cached for, according to its
+    `Cache-Control` header.
+    """
+    cache_control = headers.get("Cache-Control", "")
+    match = MAX_AGE_PATTERN.search(cache_control)
+    if match is None:
+        seconds = DEFAULT_CACHE_SECONDS
+    else:
+        seconds = int(match.group(1))
+    return min(max(seconds, MIN_CACHE_SECONDS), MAX_CACHE_SECONDS)
+
+
+def _get_document(url: str, refresh: bool = False) -> Dict:
+    """Returns the JSON document at the given url, from the cache if it
+    hasn't expired (unless a refresh is requested).
+
+    If fetching the document fails, the cached one is returned even if it
+    has expired.
+    """
+    now = time.monotonic()
+    with _documents_lock:
+        cached = _documents.get(url, None)
+    if cached is not None and not refresh and now < cached[0]:
+        return cached[1]
+
+    try:
+        response = http.get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        document = response.json()
+    except (requests.RequestException, ValueError):
+        if cached is None:
+            raise
+        return cached[1]
+
+    with _documents_lock:
+        _documents[url] = (now + _cache_seconds(response.headers), document)
+    return document
+
+
+def get_provider_cfg(discovery_url: str) -> Dict:
+    """Returns the provider's discovery document."""
+    return _get_document(discovery_url)
+
+
+# =============================================================================
+
+
+def _find_key(jwks_uri: str, key_id: Optional[str]) -> jwt.PyJWK:
+    """Returns the provider's signing key with the given id.
+
+    The keys are fetched again if the id isn't found, in case the
+    provider rotated its keys.
+    """
+    for refresh in (False, True):
+        keys = _get_document(jwks_uri, refresh=refresh).get("keys", [])
+        for key in keys:
+            if key.get("kty") == "RSA" and key.get("kid") == key_id:
+                try:
+                    signing_key = jwt.PyJWK(key, algorithm="RS256")
+                except jwt.PyJWTError as ex:
+                    raise InvalidIdTokenError(
+                        f"invalid signing key: {ex}"
+                    ) from None
+                if signing_key.key.key_size < MIN_KEY_BITS:
+                    raise InvalidIdTokenError("signing key is too small")
+                return signing_key
+    raise InvalidIdTokenError(f"unknown signing key: {key_id}")
+
+
+def _check_issuer(issuer: Optional[str], expected: str):
+    # Google also issues tokens without the scheme
+    expected_issuers = {expected, expected.removeprefix("https://")}
+    if issuer not in expected_issuers:
+        raise InvalidIdTokenError(f"unexpected issuer: {issuer}")
+
+
+def verify_id_token(id_token: str, discovery_url: str, client_id: str) -> Dict:
+    """Verifies the signature and claims of the given `id_token`, and
+    returns its claims.
+
+    Raises an `InvalidIdTokenError` if the token is not valid.
+    """
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except jwt.PyJWTError as ex:
+        raise InvalidIdTokenError(f"malformed token: {ex}") from None
+
+    provider_cfg = get_provider_cfg(discovery_url)
+    key = _find_key(provider_cfg["jwks_uri"], header.get("kid"))
+    try:
+        claims = jwt.decode(
+            id_token,
+            key.key,
+            algorithms=["RS256"],
+            audience=client_id,
+            leeway=CLOCK_SKEW_SECONDS,
+            options={"require": REQUIRED_CLAIMS},
+        )
+    except jwt.PyJWTError as ex:
+        raise InvalidIdTokenError(str(ex)) from None
+    # PyJWT only checks for a single issuer
+    _check_issuer(claims["iss"], provider_cfg["issuer"])
+
+    return claims
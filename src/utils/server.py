@@ -4,17 +4,26 @@ Utilities for the server.
 
 # =============================================================================
 
-from flask import make_response, render_template
+import hashlib
+from pathlib import Path
+
+from flask import current_app, make_response, render_template
 
 # =============================================================================
 
 __all__ = (
     "AppRoutes",
     "_render",
+    "get_templates_hash",
 )
 
 # =============================================================================
 
+# A hash of the template files, computed on first use
+_templates_hash = None
+
+# =============================================================================
+
 
 class AppRoutes:
     """Contains all the routes defined in a module.
@@ -68,3 +77,26 @@ def _render(template_file, **kwargs):
     html = render_template(template_file, **kwargs)
     response = make_response(html)
     return response
+
+
+def get_templates_hash() -> str:
+    """Returns a hash of the app's template files.
+
+    Responses with rendered HTML can include it in their ETags, since the
+    templates may change on any deployment. It's only computed once,
+    unless the app is in debug mode (where templates are reloaded).
+    """
+    global _templates_hash  # pylint: disable=global-statement
+
+    if _templates_hash is not None and not current_app.debug:
+        return _templates_hash
+    folder = Path(current_app.root_path) / current_app.template_folder
+    content_hash = hashlib.sha256()
+    for path in sorted(folder.rglob("*")):
+        if not path.is_file():
+            continue
+        content_hash.update(path.relative_to(folder).as_posix().encode())
+        content_hash.update(b"\0")
+        content_hash.update(path.read_bytes())
+    _templates_hash = content_hash.hexdigest()[:16]
+    return _templates_hash
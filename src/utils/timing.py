@@ -0,0 +1,218 @@
+"""
+Utilities for timing requests.
+
+Counts the database statements of each request and times them, along
+with template rendering and the request as a whole. The times are sent
+back in a `Server-Timing` header and aggregated per endpoint, and slow
+statements are logged.
+"""
+
+# =============================================================================
+
+import threading
+from functools import partial
+from time import perf_counter
+from typing import Dict
+
+from flask import (
+    before_render_template,
+    current_app,
+    g,
+    has_request_context,
+    request,
+    template_rendered,
+)
+from sqlalchemy import event
+
+from backend.models import db
+
+# =============================================================================
+
+__all__ = (
+    "init_app",
+    "get_endpoint_stats",
+)
+
+# =============================================================================
+
+# Aggregated timings per endpoint for this worker
+_endpoint_stats = {}
+_endpoint_stats_lock = threading.Lock()
+
+# =============================================================================
+
+
+class _RequestTiming:
+    """The timings of the current request."""
+
+    __slots__ = (
+        "start",
+        "db_statements",
+        "db_time",
+        "template_start",
+        "template_time",
+    )
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.db_statements = 0
+        self.db_time = 0
+        self.template_start = None
+        self.template_time = 0
+
+
+def _get_request_timing():
+    """Returns the timings of the current request, or None if there is
+    no request (such as when running a CLI command).
+    """
+    if not has_request_context():
+        return None
+    return g.get("_request_timing", None)
+
+
+# =============================================================================
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):  # pylint: disable=unused-argument,too-many-arguments
+    # Stored on the execution context so that nothing is left behind if the
+    # statement fails
+    context.timing_start = perf_counter()
+
+
+def _after_cursor_execute(
+    conn,
+    cursor,
+    statement,
+    parameters,
+    context,
+    executemany,
+    *,
+    threshold_ms,
+    logger,
+):  # pylint: disable=unused-argument,too-many-arguments
+    # The threshold and logger are bound when the listener is added, since
+    # statements may also be executed outside of an app context
+    elapsed = perf_counter() - context.timing_start
+
+    timing = _get_request_timing()
+    if timing is not None:
+        timing.db_statements += 1
+        timing.db_time += elapsed
+
+    if threshold_ms is not None and elapsed * 1000 >= threshold_ms:
+        endpoint = request.endpoint if has_request_context() else None
+        logger.warning(
+            "Slow query (%.1f ms) in endpoint %s: %s",
+            elapsed * 1000,
+            endpoint,
+            statement,
+        )
+
+
+def _before_render_template(
+    sender, template, context, **extra
+):  # pylint: disable=unused-argument
+    timing = _get_request_timing()
+    if timing is not None:
+        timing.template_start = perf_counter()
+
+
+def _template_rendered(
+    sender, template, context, **extra
+):  # pylint: disable=unused-argument
+    timing = _get_request_timing()
+    if timing is not None and timing.template_start is not None:
+        timing.template_time += perf_counter() - timing.template_start
+        timing.template_start = None
+
+
+def _start_request_timing():
+    g._request_timing = _RequestTiming()  # pylint: disable=protected-access
+
+
+def _finish_request_timing(response):
+    timing = _get_request_timing()
+    if timing is None:
+        return response
+    total_time = perf_counter() - timing.start
+
+    if current_app.config.get("SERVER_TIMING", False):
+        response.headers["Server-Timing"] = ", ".join(
+            (
+                f"db;dur={timing.db_time * 1000:.1f};"
+                f'desc="{timing.db_statements} statements"',
+                f"template;dur={timing.template_time * 1000:.1f}",
+                f"total;dur={total_time * 1000:.1f}",
+            )
+        )
+
+    # Requests that didn't match a route (such as 404s) have no endpoint
+    endpoint = request.endpoint
+    if endpoint is not None:
+        with _endpoint_stats_lock:
+            stats = _endpoint_stats.get(endpoint, None)
+            if stats is None:
+                stats = _endpoint_stats[endpoint] = {
+                    "requests": 0,
+                    "dbStatements": 0,
+                    "dbMs": 0,
+                    "templateMs": 0,
+                    "totalMs": 0,
+                    "maxTotalMs": 0,
+                }
+            stats["requests"] += 1
+            stats["dbStatements"] += timing.db_statements
+            stats["dbMs"] += timing.db_time * 1000
+            stats["templateMs"] += timing.template_time * 1000
+            stats["totalMs"] += total_time * 1000
+            stats["maxTotalMs"] = max(stats["maxTotalMs"], total_time * 1000)
+
+    return response
+
+
+# =============================================================================
+
+
+def init_app(app):
+    """Sets up request timing for the app.
+
+    Must be called after the database is set up.
+    """
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(
+        engine,
+        "after_cursor_execute",
+        partial(
+            _after_cursor_execute,
+            threshold_ms=app.config.get("SLOW_QUERY_THRESHOLD_MS", None),
+            logger=app.logger,
+        ),
+    )
+
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+    app.before_request(_start_request_timing)
+    app.after_request(_finish_request_timing)
+
+
+def get_endpoint_stats() -> Dict[str, Dict]:
+    """Returns the aggregated timings of each endpoint handled by this
+    worker, including the average times per request.
+    """
+    with _endpoint_stats_lock:
+        all_stats = {
+            endpoint: dict(stats)
+            for endpoint, stats in _endpoint_stats.items()
+        }
+    for stats in all_stats.values():
+        num_requests = stats["requests"]
+        stats["avgDbStatements"] = stats["dbStatements"] / num_requests
+        stats["avgDbMs"] = stats["dbMs"] / num_requests
+        stats["avgTemplateMs"] = stats["templateMs"] / num_requests
+        stats["avgTotalMs"] = stats["totalMs"] / num_requests
+    return all_stats
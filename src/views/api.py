@@ -5,13 +5,23 @@ API methods.
 # =============================================================================
 
 from functools import wraps
-from typing import Dict, Optional, Tuple
-
-from flask import render_template, request, url_for
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import (
+    Response,
+    current_app,
+    make_response,
+    render_template,
+    request,
+    url_for,
+)
 
 import backend
+from backend._markdown import RENDERER_VERSION
+from utils import assets, changelog, timing
 from utils.auth import get_logged_in_user
-from utils.server import AppRoutes
+from utils.server import AppRoutes, get_templates_hash
 
 # =============================================================================
 
@@ -40,10 +50,56 @@ def api_route(rule, **options):
     return decorator
 
 
+def _etag_salt():
+    # Responses may change between deployments even if the data doesn't,
+    # such as when the rendered HTML of the notes changes
+    return (
+        f"{changelog.get_latest_version()}-{RENDERER_VERSION}-"
+        f"{get_templates_hash()}-{assets.get_manifest_hash()}"
+    )
+
+
+def conditional_get(func):
+    """A decorator for an API route (under `api_route`) whose response
+    only depends on the request and the data that the session user can
+    see.
+
+    The user's data version is used as the ETag, so if the client already
+    has the current version, a 304 is returned without calling the route.
+    """
+
+    @wraps(func)
+    def wrapper(session_user, *args, **kwargs):
+        version = backend.user.get_data_version(session_user["id"])
+        if version is None:
+            return func(session_user, *args, **kwargs)
+        # Include the user so that the cached responses of different users
+        # (on the same browser) never match
+        etag = f"{session_user['id']}-{version}-{_etag_salt()}"
+        if request.if_none_match.contains_weak(etag):
+            response = make_response("", 304)
+        else:
+            result = func(session_user, *args, **kwargs)
+            # Check the result before it's serialized, rather than parsing
+            # the (possibly large) response again
+            if not isinstance(result, dict) or not result.get("success"):
+                # Don't cache errors
+                return result
+            response = make_response(result)
+        response.set_etag(etag)
+        # Browsers must check with the server before using a cached response
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
+
+
 # =============================================================================
 
 
-@app.route("/api/<path:subpath>", methods=["GET", "POST", "DELETE"])
+@app.route(
+    "/api/<path:subpath>", methods=["GET", "POST", "PUT", "PATCH", "DELETE"]
+)
 def unrecognized_api_method(subpath):
     return {
         "success": False,
@@ -54,29 +110,172 @@ def unrecognized_api_method(subpath):
 # =============================================================================
 
 
+@api_route("/api/admin/timings", methods=["GET"])
+def list_endpoint_timings(session_user):
+    """Returns the aggregated request timings of each endpoint handled by
+    this worker.
+    """
+    if not session_user["is_admin"]:
+        return {"success": False, "error": "User is not an admin"}
+    return {"success": True, "endpoints": timing.get_endpoint_stats()}
+
+
+@api_route("/api/admin/caches", methods=["GET"])
+def list_cache_stats(session_user):
+    """Returns the stats of each of this worker's caches."""
+    if not session_user["is_admin"]:
+        return {"success": False, "error": "User is not an admin"}
+    return {"success": True, "caches": backend.get_cache_stats()}
+
+
+@api_route("/api/admin/streams", methods=["GET"])
+def list_stream_stats(session_user):
+    """Returns the number of streams open in this worker."""
+    if not session_user["is_admin"]:
+        return {"success": False, "error": "User is not an admin"}
+    return {"success": True, "streams": backend.stream.get_stats()}
+
+
+# =============================================================================
+
+
+def _event_stream(stream, heartbeat_seconds, max_seconds):
+    """Yields the events of the given stream as server-sent events until
+    the stream has been open for the given number of seconds.
+    """
+    # How long the client waits before reconnecting
+    yield "retry: 5000\n\n"
+    deadline = monotonic() + max_seconds
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            break
+        event_names = stream.wait(min(heartbeat_seconds, remaining))
+        if len(event_names) == 0:
+            # A comment, which clients ignore
+            yield ": heartbeat\n\n"
+            continue
+        for event_name in event_names:
+            yield f"event: {event_name}\ndata: {{}}\n\n"
+
+
+@api_route("/api/stream", methods=["GET"])
+def stream_events(session_user):
+    """Streams events about the user's notes and friend requests as
+    server-sent events, as they happen.
+
+    The events only say what changed, so clients should fetch the latest
+    data when they receive one. The `resync` event means that events may
+    have been missed.
+    """
+    stream = backend.stream.connect(session_user["id"])
+    if stream is None:
+        # The client should poll instead
+        return {"success": False, "error": "Streaming is not available"}
+    # The app context (and so the database session) ends before the events
+    # are streamed, so open streams don't hold a database connection. Don't
+    # use `stream_with_context()`, which would keep it.
+    response = Response(
+        _event_stream(
+            stream,
+            current_app.config["STREAM_HEARTBEAT_SECONDS"],
+            current_app.config["STREAM_MAX_SECONDS"],
+        ),
+        mimetype="text/event-stream",
+    )
+    # Closed even if the response is never iterated
+    response.call_on_close(stream.close)
+    response.headers["Cache-Control"] = "no-cache"
+    # Tell proxies (such as nginx) not to buffer the events
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+# =============================================================================
+
+
 @api_route("/api/friends/", methods=["GET"])
+@conditional_get
 def list_user_friends(session_user):
-    users = backend.friend.get_all(session_user["id"])
-    return {"success": True, "users": [user.to_json() for user in users]}
+    """Returns the user's friends, sorted by username.
 
+    Optional args: `prefix` to only include usernames starting with it,
+    and `limit` and `after` (the `nextCursor` of the previous page) to
+    paginate. All the friends are returned if there is no limit.
+    """
+    LIMIT_KEY = "limit"
 
-@api_route("/api/friends/<int:user_id>/", methods=["POST", "DELETE"])
-def update_friendship(session_user, user_id):
-    session_user_id = session_user["id"]
+    limit = request.args.get(LIMIT_KEY, None)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return {
+                "success": False,
+                "error": f"Invalid request args: expected int for "
+                f"{LIMIT_KEY!r} arg",
+            }
+        if not 1 <= limit <= backend.friend.MAX_PAGE_SIZE:
+            return {
+                "success": False,
+                "error": f"Invalid request args: {LIMIT_KEY!r} arg must be "
+                f"between 1 and {backend.friend.MAX_PAGE_SIZE}",
+            }
+
+    friends, next_cursor = backend.friend.get_all(
+        session_user["id"],
+        prefix=request.args.get("prefix", None),
+        limit=limit,
+        after=request.args.get("after", None),
+    )
+    return {
+        "success": True,
+        "users": [friend.to_json() for friend in friends],
+        "nextCursor": next_cursor,
+    }
+
+
+def _accept_friend_request(session_user_id: int, user_id: int) -> Dict:
+    """Accepts the friend request from `user_id`."""
+    user = backend.user.get(user_id)
+    if user is None:
+        return {"success": False, "error": "Requested user does not exist"}
 
+    try:
+        backend.friend.accept_request(user_id, session_user_id)
+    except ValueError as ex:
+        return {"success": False, "error": str(ex)}
+    return {"success": True}
+
+
+def _set_friend_nickname(
+    session_user_id: int, user_id: int, nickname: str
+) -> Dict:
+    """Sets the nickname of the friend `user_id`."""
     user = backend.user.get(user_id)
     if user is None:
         return {"success": False, "error": "Requested user does not exist"}
 
+    try:
+        backend.friend.set_nickname(session_user_id, user_id, nickname)
+    except ValueError as ex:
+        return {"success": False, "error": str(ex)}
+    return {"success": True}
+
+
+@api_route("/api/friends/<int:user_id>/", methods=["POST", "DELETE"])
+def update_friendship(session_user, user_id):
+    session_user_id = session_user["id"]
+
     if request.method == "POST":
         # Accept friend request from `user_id`
-        try:
-            backend.friend.accept_request(user_id, session_user_id)
-        except ValueError as ex:
-            return {"success": False, "error": str(ex)}
-        return {"success": True}
+        return _accept_friend_request(session_user_id, user_id)
 
-    elif request.method == "DELETE":
+    user = backend.user.get(user_id)
+    if user is None:
+        return {"success": False, "error": "Requested user does not exist"}
+
+    if request.method == "DELETE":
         # Remove friend
         try:
             backend.friend.remove(user_id, session_user_id)
@@ -89,12 +288,6 @@ def update_friendship(session_user, user_id):
 
 @api_route("/api/friends/<int:user_id>/nickname", methods=["POST"])
 def update_friend_nickname(session_user, user_id):
-    session_user_id = session_user["id"]
-
-    user = backend.user.get(user_id)
-    if user is None:
-        return {"success": False, "error": "Requested user does not exist"}
-
     # Get request args
     args = request.get_json(silent=True)
     if args is None:
@@ -107,23 +300,21 @@ def update_friend_nickname(session_user, user_id):
         }
     nickname = str(nickname).strip()
 
-    try:
-        backend.friend.set_nickname(session_user_id, user_id, nickname)
-    except ValueError as ex:
-        return {"success": False, "error": str(ex)}
-    return {"success": True}
+    return _set_friend_nickname(session_user["id"], user_id, nickname)
 
 
 # =============================================================================
 
 
 @api_route("/api/friend_requests/outgoing", methods=["GET"])
+@conditional_get
 def list_user_outgoing_friend_requests(session_user):
     users = backend.friend.get_outgoing_friend_requests(session_user["id"])
     return {"success": True, "users": [user.to_json() for user in users]}
 
 
 @api_route("/api/friend_requests/incoming", methods=["GET"])
+@conditional_get
 def list_user_incoming_friend_requests(session_user):
     users = backend.friend.get_incoming_friend_requests(session_user["id"])
     return {"success": True, "users": [user.to_json() for user in users]}
@@ -156,10 +347,8 @@ def update_friend_request(session_user, user_id):
     return {"success": False, "error": f"Unsupported method: {request.method}"}
 
 
-@api_route("/api/friend_requests/<int:user_id>/reject", methods=["DELETE"])
-def reject_friend_request(session_user, user_id):
-    session_user_id = session_user["id"]
-
+def _reject_friend_request(session_user_id: int, user_id: int) -> Dict:
+    """Rejects the friend request from `user_id`."""
     user = backend.user.get(user_id)
     if user is None:
         return {"success": False, "error": "Requested user does not exist"}
@@ -171,6 +360,11 @@ def reject_friend_request(session_user, user_id):
     return {"success": True}
 
 
+@api_route("/api/friend_requests/<int:user_id>/reject", methods=["DELETE"])
+def reject_friend_request(session_user, user_id):
+    return _reject_friend_request(session_user["id"], user_id)
+
+
 # =============================================================================
 
 
@@ -194,14 +388,15 @@ def unsend_all_notes(session_user):
 
 @api_route("/api/danger/notes", methods=["DELETE"])
 def delete_all_received_notes(session_user):
-    backend.note.delete_all_received_notes(session_user["id"])
-    return {"success": True}
+    num_deleted = backend.note.delete_all_received_notes(session_user["id"])
+    return {"success": True, "numNotes": num_deleted}
 
 
 # =============================================================================
 
 
 @api_route("/api/drafts/", methods=["GET"])
+@conditional_get
 def list_drafts(session_user):
     session_user_id = session_user["id"]
 
@@ -223,7 +418,7 @@ def list_drafts(session_user):
 
     return {
         "success": True,
-        "notes": [draft.to_json() for draft in drafts],
+        "notes": backend.models.DraftNote.list_to_json(drafts),
     }
 
 
@@ -255,6 +450,68 @@ def _get_draft_args(
     return recipient_id, text
 
 
+def _get_draft_splices(args: Dict) -> Tuple[int, List[backend.note.Splice]]:
+    """Gets and validates the args to patch the text of a draft note.
+
+    Errors should be handled by the caller.
+    """
+    VERSION_KEY = "version"
+    SPLICES_KEY = "splices"
+
+    version = args.get(VERSION_KEY, None)
+    if version is None:
+        raise ValueError(f"missing {VERSION_KEY!r} key")
+    if not isinstance(version, int):
+        raise ValueError(f"expected int for {VERSION_KEY!r} key")
+
+    splices = args.get(SPLICES_KEY, None)
+    if splices is None:
+        raise ValueError(f"missing {SPLICES_KEY!r} key")
+    if not isinstance(splices, list):
+        raise ValueError(f"expected list for {SPLICES_KEY!r} key")
+    parsed = []
+    for splice in splices:
+        try:
+            start = splice["start"]
+            delete_count = splice["deleteCount"]
+            text = splice["text"]
+        except (KeyError, TypeError):
+            raise ValueError(
+                f"expected objects with 'start', 'deleteCount', and 'text' "
+                f"keys in {SPLICES_KEY!r} key"
+            ) from None
+        if not (
+            isinstance(start, int)
+            and isinstance(delete_count, int)
+            and isinstance(text, str)
+        ):
+            raise ValueError(f"invalid splice in {SPLICES_KEY!r} key")
+        parsed.append(backend.note.Splice(start, delete_count, text))
+
+    return version, parsed
+
+
+def _draft_conflict(draft_id: int):
+    """Returns a 409 response with the current version of the draft, so
+    that the client can reapply its changes on top of it.
+    """
+    draft = backend.note.get_draft(draft_id)
+    if draft is None:
+        return {
+            "success": False,
+            "error": f"Draft not found with ID: {draft_id}",
+        }
+    return (
+        {
+            "success": False,
+            "error": "Draft was changed elsewhere",
+            "version": draft.version,
+            "text": draft.text,
+        },
+        409,
+    )
+
+
 @api_route("/api/drafts/", methods=["POST"])
 def create_draft_note(session_user):
     session_user_id = session_user["id"]
@@ -280,7 +537,7 @@ def create_draft_note(session_user):
     }
 
 
-@api_route("/api/drafts/<int:draft_id>", methods=["POST", "DELETE"])
+@api_route("/api/drafts/<int:draft_id>", methods=["POST", "PATCH", "DELETE"])
 def update_draft_note(session_user, draft_id):
     session_user_id = session_user["id"]
 
@@ -307,8 +564,32 @@ def update_draft_note(session_user, draft_id):
         except ValueError as ex:
             return {"success": False, "error": f"Invalid JSON data: {ex}"}
 
-        backend.note.edit_draft(draft, recipient_id, text)
-        return {"success": True}
+        try:
+            backend.note.edit_draft(draft, recipient_id, text)
+        except backend.note.DraftConflictError:
+            return _draft_conflict(draft_id)
+        except ValueError as ex:
+            return {"success": False, "error": str(ex)}
+        return {"success": True, "version": draft.version}
+
+    elif request.method == "PATCH":
+        # Update the draft's text with only what changed, if the client
+        # has the current version of the draft
+        args = request.get_json(silent=True)
+        if args is None:
+            return {"success": False, "error": "Invalid JSON data"}
+        try:
+            version, splices = _get_draft_splices(args)
+        except ValueError as ex:
+            return {"success": False, "error": f"Invalid JSON data: {ex}"}
+
+        try:
+            backend.note.patch_draft(draft, version, splices)
+        except backend.note.DraftConflictError:
+            return _draft_conflict(draft_id)
+        except ValueError as ex:
+            return {"success": False, "error": str(ex)}
+        return {"success": True, "version": draft.version}
 
     elif request.method == "DELETE":
         # Delete draft
@@ -347,98 +628,164 @@ def send_draft(session_user):
         return {"success": False, "error": f"Invalid JSON data: {ex}"}
 
     try:
-        draft = None
-        if draft_id is not None:
-            draft = backend.note.get_draft(draft_id)
-            if draft is None:
-                return {
-                    "success": False,
-                    "error": f"Draft not found with ID: {draft_id}",
-                }
-            if draft.user_id != session_user_id:
-                return {
-                    "success": False,
-                    "error": "Draft does not belong to requesting user",
-                }
-            if recipient_id is not None:
-                draft.set_recipient_id(recipient_id)
-            else:
-                recipient_id = draft.recipient_id
-            if text is not None:
-                draft.set_text(text)
-            else:
-                text = draft.text
-
-            if not draft.is_ready_to_send():
-                return {
-                    "success": False,
-                    "error": "Draft is not ready to send",
-                }
-
-        note = backend.note.create(session_user_id, recipient_id, text)
-
-        if draft is not None:
-            # Delete the draft
-            backend.note.delete_draft(draft)
+        note_id = backend.note.send(
+            session_user_id, recipient_id, text, draft_id=draft_id
+        )
     except ValueError as ex:
         return {"success": False, "error": str(ex)}
 
-    return {"success": True, "noteId": note.id}
+    return {"success": True, "noteId": note_id}
 
 
 # =============================================================================
 
 
-@api_route("/api/notes/", methods=["GET"])
-def list_notes(session_user):
-    session_user_id = session_user["id"]
+def _get_page_args(
+    args: Dict,
+) -> Tuple[int, Optional[backend.note.NoteCursor]]:
+    """Gets and validates the pagination args for a list of notes.
 
-    as_html = "html" in request.args
+    Errors should be handled by the caller.
+    """
+    LIMIT_KEY = "limit"
+    BEFORE_KEY = "before"
 
-    notes = backend.note.get_all(session_user_id)
+    limit = args.get(LIMIT_KEY, None)
+    if limit is None:
+        limit = backend.note.DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError(f"expected int for {LIMIT_KEY!r} arg") from None
+        if not 1 <= limit <= backend.note.MAX_PAGE_SIZE:
+            raise ValueError(
+                f"{LIMIT_KEY!r} arg must be between 1 and "
+                f"{backend.note.MAX_PAGE_SIZE}"
+            )
+    before = args.get(BEFORE_KEY, None)
+    if before is not None:
+        before = backend.note.parse_cursor(before)
 
-    if as_html:
+    return limit, before
+
+
+def _notes_page_response(notes, next_cursor, is_first_page, are_deleted):
+    """Returns the API response for a page of notes."""
+    if "html" in request.args:
         return {
             "success": True,
             "numNotes": len(notes),
             "notesHtml": render_template(
                 "notes/notes_list.jinja",
-                are_deleted=False,
+                are_deleted=are_deleted,
                 are_drafts=False,
+                # The modals only need to be included once
+                include_modals=is_first_page,
                 notes=notes,
             ),
+            "nextCursor": next_cursor,
         }
 
     return {
         "success": True,
-        "notes": [note.to_json() for note in notes],
+        "notes": backend.models.Note.list_to_json(notes),
+        "nextCursor": next_cursor,
     }
 
 
-@api_route("/api/notes/deleted", methods=["GET"])
-def list_deleted_notes(session_user):
+@api_route("/api/notes/", methods=["GET"])
+@conditional_get
+def list_notes(session_user):
     session_user_id = session_user["id"]
 
-    as_html = "html" in request.args
+    try:
+        limit, before = _get_page_args(request.args)
+    except ValueError as ex:
+        return {"success": False, "error": f"Invalid request args: {ex}"}
 
-    notes = backend.note.get_deleted(session_user_id)
+    if before is None:
+        # Get the cursor first so that no changes are missed
+        changes_cursor = backend.note.get_changes_cursor(session_user_id)
+    notes, next_cursor = backend.note.get_all(session_user_id, limit, before)
 
-    if as_html:
+    response = _notes_page_response(
+        notes, next_cursor, is_first_page=before is None, are_deleted=False
+    )
+    if before is None:
+        response["changesCursor"] = changes_cursor
+    return response
+
+
+@api_route("/api/notes/changes", methods=["GET"])
+@conditional_get
+def list_note_changes(session_user):
+    """Returns the changes to the user's notes since the `since` cursor
+    (the `changesCursor` of the first page of notes, or the `cursor` of
+    the previous changes).
+
+    If `reset` is true, the client should reload all the notes instead.
+    """
+    SINCE_KEY = "since"
+
+    since = request.args.get(SINCE_KEY, None)
+    if since is None:
         return {
-            "success": True,
-            "numNotes": len(notes),
-            "notesHtml": render_template(
-                "notes/notes_list.jinja",
-                are_deleted=True,
-                are_drafts=False,
-                notes=notes,
-            ),
+            "success": False,
+            "error": f"Invalid request args: missing {SINCE_KEY!r} arg",
         }
+    try:
+        changes = backend.note.get_changes(session_user["id"], since)
+    except ValueError as ex:
+        return {"success": False, "error": f"Invalid request args: {ex}"}
 
-    return {
+    if changes is None:
+        return {"success": True, "reset": True}
+
+    response = {
         "success": True,
-        "notes": [note.to_json() for note in notes],
+        "reset": False,
+        "removedIds": changes.removed_ids,
+        "cursor": changes.cursor,
     }
+    if "html" in request.args:
+        response["numNotes"] = len(changes.notes)
+        response["notesHtml"] = render_template(
+            "notes/notes_list.jinja",
+            are_deleted=False,
+            are_drafts=False,
+            include_modals=False,
+            notes=changes.notes,
+        )
+    else:
+        response["notes"] = backend.models.Note.list_to_json(changes.notes)
+    return response
+
+
+@api_route("/api/notes/deleted", methods=["GET"])
+@conditional_get
+def list_deleted_notes(session_user):
+    session_user_id = session_user["id"]
+
+    try:
+        limit, before = _get_page_args(request.args)
+    except ValueError as ex:
+        return {"success": False, "error": f"Invalid request args: {ex}"}
+
+    notes, next_cursor = backend.note.get_deleted(
+        session_user_id, limit, before
+    )
+
+    return _notes_page_response(
+        notes, next_cursor, is_first_page=before is None, are_deleted=True
+    )
+
+
+@api_route("/api/notes/deleted/restore", methods=["POST"])
+def undelete_all_notes(session_user):
+    """Undeletes all the notes the requesting user has deleted."""
+    num_restored = backend.note.undelete_all_for_user(session_user["id"])
+    return {"success": True, "numNotes": num_restored}
 
 
 @api_route("/api/notes/favorites", methods=["POST"])
@@ -464,15 +811,71 @@ def toggle_favorite(session_user):
     except ValueError as ex:
         return {"success": False, "error": f"Invalid JSON data: {ex}"}
 
+    return _toggle_favorite(session_user_id, note_id)
+
+
+def _note_not_found(note_id: int) -> Dict:
+    return {"success": False, "error": f"Note not found with ID: {note_id}"}
+
+
+def _toggle_favorite(session_user_id: int, note_id: int) -> Dict:
+    """Toggles whether the note is favorited."""
+    is_favorite = backend.note.toggle_favorite(session_user_id, note_id)
+    if is_favorite is None:
+        return _note_not_found(note_id)
+    return {"success": True, "isFavorite": is_favorite}
+
+
+def _set_note_favorite(
+    session_user_id: int, note_id: int, favorite: bool
+) -> Dict:
+    """Favorites or unfavorites the note."""
+    changed = backend.note.set_favorite(session_user_id, note_id, favorite)
+    if changed is None:
+        return _note_not_found(note_id)
+    return {"success": True, "isFavorite": favorite, "changed": changed}
+
+
+def _set_note_deleted(
+    session_user_id: int, note_id: int, deleted: bool
+) -> Dict:
+    """Deletes or undeletes the note for the requesting user only."""
+    changed = backend.note.set_deleted(session_user_id, note_id, deleted)
+    if changed is None:
+        return _note_not_found(note_id)
+    return {"success": True, "changed": changed}
+
+
+def _unsend_note(session_user_id: int, note_id: int) -> Dict:
+    """Unsends the note (deletes for everyone)."""
     note = backend.note.get(note_id)
     if note is None:
+        return _note_not_found(note_id)
+    if note.sender_id != session_user_id:
         return {
             "success": False,
-            "error": f"Note not found with ID: {note_id}",
+            "error": "Note does not belong to requesting user",
         }
 
-    is_favorite = backend.note.toggle_favorite(session_user_id, note.id)
-    return {"success": True, "isFavorite": is_favorite}
+    backend.note.unsend(note)
+    return {"success": True}
+
+
+@api_route("/api/notes/<int:note_id>/favorite", methods=["PUT", "DELETE"])
+def set_note_favorite(session_user, note_id):
+    """Favorites or unfavorites the given note for the requesting user.
+
+    PUT will favorite the note, while DELETE will unfavorite it. Both are
+    idempotent, so retrying them is safe.
+    """
+    # Note: This URL is hard-coded in `notes.js` since templating is not
+    # available there
+    if request.method == "PUT":
+        return _set_note_favorite(session_user["id"], note_id, True)
+    elif request.method == "DELETE":
+        return _set_note_favorite(session_user["id"], note_id, False)
+
+    return {"success": False, "error": f"Unsupported method: {request.method}"}
 
 
 @api_route("/api/notes/<int:note_id>/delete", methods=["POST", "DELETE"])
@@ -481,21 +884,10 @@ def delete_note(session_user, note_id):
 
     POST will undelete the note, while DELETE will delete it.
     """
-    session_user_id = session_user["id"]
-
-    note = backend.note.get(note_id)
-    if note is None:
-        return {
-            "success": False,
-            "error": f"Note not found with ID: {note_id}",
-        }
-
     if request.method == "POST":
-        backend.note.undelete_for_user(note, session_user_id)
-        return {"success": True}
+        return _set_note_deleted(session_user["id"], note_id, False)
     elif request.method == "DELETE":
-        backend.note.delete_for_user(note, session_user_id)
-        return {"success": True}
+        return _set_note_deleted(session_user["id"], note_id, True)
 
     return {"success": False, "error": f"Unsupported method: {request.method}"}
 
@@ -503,19 +895,191 @@ def delete_note(session_user, note_id):
 @api_route("/api/notes/<int:note_id>/unsend", methods=["DELETE"])
 def unsend_note(session_user, note_id):
     """Unsends the note (deletes for everyone)."""
-    session_user_id = session_user["id"]
+    return _unsend_note(session_user["id"], note_id)
 
-    note = backend.note.get(note_id)
-    if note is None:
+
+# The bulk actions on notes, mapped to the backend method for each one
+BULK_NOTE_ACTIONS = {
+    "favorite": backend.note.favorite_many,
+    "unfavorite": backend.note.unfavorite_many,
+    "delete": backend.note.delete_many_for_user,
+    "undelete": backend.note.undelete_many_for_user,
+}
+
+
+@api_route("/api/notes/bulk/<action>", methods=["POST"])
+def update_notes_in_bulk(session_user, action):
+    """Favorites, unfavorites, deletes, or undeletes the notes with the
+    given `noteIds` for the requesting user only. Notes that weren't sent
+    by or sent to the user are skipped.
+
+    Returns the ids of the notes that changed.
+    """
+    NOTE_IDS_KEY = "noteIds"
+
+    if action not in BULK_NOTE_ACTIONS:
+        return {"success": False, "error": f"Unsupported action: {action}"}
+
+    args = request.get_json(silent=True)
+    if args is None:
+        return {"success": False, "error": "Invalid JSON data"}
+    note_ids = args.get(NOTE_IDS_KEY, None)
+    if not isinstance(note_ids, list):
         return {
             "success": False,
-            "error": f"Note not found with ID: {note_id}",
+            "error": f"Invalid JSON data: expected list for "
+            f"{NOTE_IDS_KEY!r} key",
         }
-    if note.sender_id != session_user_id:
+    if len(note_ids) > backend.note.MAX_PAGE_SIZE:
         return {
             "success": False,
-            "error": "Note does not belong to requesting user",
+            "error": f"Invalid JSON data: at most "
+            f"{backend.note.MAX_PAGE_SIZE} notes are allowed",
+        }
+    try:
+        note_ids = [int(note_id) for note_id in note_ids]
+    except (TypeError, ValueError):
+        return {
+            "success": False,
+            "error": f"Invalid JSON data: expected ints in {NOTE_IDS_KEY!r} "
+            "key",
         }
 
-    backend.note.unsend(note)
-    return {"success": True}
+    changed_ids = BULK_NOTE_ACTIONS[action](session_user["id"], note_ids)
+    return {"success": True, "noteIds": changed_ids}
+
+
+# =============================================================================
+
+
+def _batch_id(value) -> int:
+    # `bool` is a subclass of `int`, and other numbers would be truncated
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise TypeError("expected an integer")
+    return value
+
+
+def _batch_nickname(value) -> str:
+    if not isinstance(value, str):
+        raise TypeError("expected a string")
+    return value.strip()
+
+
+# The operations that can be run in a batch, mapped to the function that
+# runs each one and the keys of its args (after the session user's id),
+# along with a function that validates and converts each arg
+BATCH_OPERATIONS = {
+    "toggleFavorite": (_toggle_favorite, (("noteId", _batch_id),)),
+    "favoriteNote": (
+        lambda session_user_id, note_id: _set_note_favorite(
+            session_user_id, note_id, True
+        ),
+        (("noteId", _batch_id),),
+    ),
+    "unfavoriteNote": (
+        lambda session_user_id, note_id: _set_note_favorite(
+            session_user_id, note_id, False
+        ),
+        (("noteId", _batch_id),),
+    ),
+    "deleteNote": (
+        lambda session_user_id, note_id: _set_note_deleted(
+            session_user_id, note_id, True
+        ),
+        (("noteId", _batch_id),),
+    ),
+    "undeleteNote": (
+        lambda session_user_id, note_id: _set_note_deleted(
+            session_user_id, note_id, False
+        ),
+        (("noteId", _batch_id),),
+    ),
+    "unsendNote": (_unsend_note, (("noteId", _batch_id),)),
+    "acceptFriendRequest": (_accept_friend_request, (("userId", _batch_id),)),
+    "rejectFriendRequest": (_reject_friend_request, (("userId", _batch_id),)),
+    "setNickname": (
+        _set_friend_nickname,
+        (("userId", _batch_id), ("nickname", _batch_nickname)),
+    ),
+}
+MAX_BATCH_OPERATIONS = 100
+
+
+def _get_batch_operation(operation: Dict) -> Tuple[Callable, List]:
+    """Gets and validates an operation to run in a batch.
+
+    Errors should be handled by the caller.
+    """
+    OP_KEY = "op"
+
+    if not isinstance(operation, dict):
+        raise ValueError("expected object")
+    op = operation.get(OP_KEY, None)
+    if op is None:
+        raise ValueError(f"missing {OP_KEY!r} key")
+    if not isinstance(op, str) or op not in BATCH_OPERATIONS:
+        raise ValueError(f"unsupported operation: {op!r}")
+    func, arg_types = BATCH_OPERATIONS[op]
+
+    args = []
+    for key, convert in arg_types:
+        value = operation.get(key, None)
+        if value is None:
+            raise ValueError(f"missing {key!r} key")
+        try:
+            args.append(convert(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid value for {key!r} key") from None
+    return func, args
+
+
+@api_route("/api/batch", methods=["POST"])
+def run_batch(session_user):
+    """Runs multiple operations in a single transaction.
+
+    Takes `operations`, a list of objects that each have an `op` key (one
+    of `BATCH_OPERATIONS`) and the keys for its args. Returns `results`,
+    which has what each operation's own route would return. Operations
+    that fail are rolled back, but don't affect the others.
+    """
+    OPERATIONS_KEY = "operations"
+
+    session_user_id = session_user["id"]
+
+    args = request.get_json(silent=True)
+    if not isinstance(args, dict):
+        return {"success": False, "error": "Invalid JSON data"}
+    operations = args.get(OPERATIONS_KEY, None)
+    if not isinstance(operations, list):
+        return {
+            "success": False,
+            "error": f"Invalid JSON data: expected list for "
+            f"{OPERATIONS_KEY!r} key",
+        }
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return {
+            "success": False,
+            "error": f"Invalid JSON data: at most {MAX_BATCH_OPERATIONS} "
+            "operations are allowed",
+        }
+    # Check all the operations before running any of them
+    parsed = []
+    for i, operation in enumerate(operations):
+        try:
+            parsed.append(_get_batch_operation(operation))
+        except ValueError as ex:
+            return {
+                "success": False,
+                "error": f"Invalid JSON data: operation {i}: {ex}",
+            }
+
+    results = []
+    with backend.batch() as savepoint:
+        for func, op_args in parsed:
+            with savepoint() as transaction:
+                result = func(session_user_id, *op_args)
+                if not result["success"]:
+                    # Undo anything the operation did before it failed
+                    transaction.rollback()
+            results.append(result)
+    return {"success": True, "results": results}
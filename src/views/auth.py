@@ -9,18 +9,20 @@ import os
 
 import requests
 from flask import current_app, redirect, request, session, url_for
-from oauthlib.oauth2 import WebApplicationClient
+from oauthlib.oauth2 import OAuth2Error, WebApplicationClient
 
 import backend
+from utils import oidc
 from utils.auth import redirect_last, set_logged_in_user
 from utils.server import AppRoutes
 
 # =============================================================================
 
-REQUEST_TIMEOUT = 60
-
-GOOGLE_DISCOVERY_URL = (
-    "https://accounts.google.com/.well-known/openid-configuration"
+# Can be overridden to log in with a fake provider for testing (with
+# `OAUTHLIB_INSECURE_TRANSPORT=1` if it isn't served over HTTPS)
+GOOGLE_DISCOVERY_URL = os.getenv(
+    "GOOGLE_DISCOVERY_URL",
+    "https://accounts.google.com/.well-known/openid-configuration",
 )
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -38,9 +40,8 @@ app = AppRoutes()
 def _get_google_provider_cfg(*keys):
     if len(keys) == 0:
         return None
-    google_provider_cfg = requests.get(
-        GOOGLE_DISCOVERY_URL, timeout=REQUEST_TIMEOUT
-    ).json()
+    # Cached, so this usually doesn't make a request
+    google_provider_cfg = oidc.get_provider_cfg(GOOGLE_DISCOVERY_URL)
     if len(keys) == 1:
         return google_provider_cfg[keys[0]]
     return [google_provider_cfg[key] for key in keys]
@@ -87,10 +88,8 @@ def login_callback():
     # Get authorization code from Google
     auth_code = request.args.get("code")
 
-    # Determine the URL for fetching the tokens and user data
-    token_endpoint, user_info_endpoint = _get_google_provider_cfg(
-        "token_endpoint", "userinfo_endpoint"
-    )
+    # Determine the URL for fetching the tokens
+    token_endpoint = _get_google_provider_cfg("token_endpoint")
 
     # Fetch and parse the tokens
     token_url, headers, body = oauth2_client.prepare_token_request(
@@ -99,28 +98,36 @@ def login_callback():
         redirect_url=request.base_url,
         code=auth_code,
     )
-    token_response = requests.post(
-        token_url,
-        headers=headers,
-        data=body,
-        auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
-        timeout=REQUEST_TIMEOUT,
-    )
-    oauth2_client.parse_request_body_response(
-        json.dumps(token_response.json())
-    )
-
-    # Fetch the user's data
-    user_info_uri, headers, body = oauth2_client.add_token(user_info_endpoint)
-    user_info = requests.get(
-        user_info_uri, headers=headers, data=body, timeout=REQUEST_TIMEOUT
-    ).json()
+    try:
+        token_response = oidc.http.post(
+            token_url,
+            headers=headers,
+            data=body,
+            auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
+            timeout=oidc.REQUEST_TIMEOUT,
+        )
+        tokens = oauth2_client.parse_request_body_response(
+            json.dumps(token_response.json())
+        )
+    except (requests.RequestException, ValueError, OAuth2Error):
+        current_app.logger.exception("Fetching the Google tokens failed")
+        return "Could not log in with Google.", 400
+
+    # The ID token has the user's info, and is verified locally (against
+    # cached keys) instead of fetching the info from Google
+    try:
+        user_info = oidc.verify_id_token(
+            tokens.get("id_token"), GOOGLE_DISCOVERY_URL, GOOGLE_CLIENT_ID
+        )
+    except (requests.RequestException, ValueError) as ex:
+        current_app.logger.warning("Invalid Google ID token: %s", ex)
+        return "Could not verify the login with Google.", 400
 
     # Example user info: {
     #   "sub": unique identifier from Google,
-    #   "picture": profile picture url,
     #   "email": email,
     #   "email_verified": True or False,
+    #   (and the standard claims of the token, such as "iss" and "exp")
     # }
 
     if not user_info.get("email_verified", False):
@@ -130,7 +137,11 @@ def login_callback():
         return "User email could not be found.", 400
 
     # Save user as logged in
-    session["user_info"] = user_info
+    session["user_info"] = {
+        key: user_info[key]
+        for key in ("sub", "email", "email_verified", "picture")
+        if key in user_info
+    }
 
     return _set_user_email(user_email)
 
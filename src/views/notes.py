@@ -26,7 +26,7 @@ def notes():
 @app.route("/notes/deleted", methods=["GET"])
 @login_required()
 def deleted_notes():
-    return _render("notes/deleted.jinja", include_markdown=True)
+    return _render("notes/deleted.jinja")
 
 
 @app.route("/notes/new", methods=["GET", "POST"])
@@ -4,8 +4,13 @@ Shared global views.
 
 # =============================================================================
 
-from utils import changelog
-from utils.auth import set_redirect_page
+import hashlib
+from time import time
+
+from flask import current_app, make_response, render_template, request, session
+
+from utils import assets, changelog
+from utils.auth import get_logged_in_user, set_redirect_page
 from utils.server import AppRoutes, _render
 
 # =============================================================================
@@ -25,8 +30,48 @@ def index():
 # =============================================================================
 
 
+def _csrf_etag_part() -> str:
+    """Returns a part of an ETag for the CSRF token in a page, which
+    changes with the session's token, and often enough that a cached
+    token never expires.
+    """
+    raw_token = session.get(current_app.config["WTF_CSRF_FIELD_NAME"], "")
+    token_hash = hashlib.sha256(raw_token.encode()).hexdigest()[:8]
+    time_limit = current_app.config["WTF_CSRF_TIME_LIMIT"]
+    if time_limit is None:
+        return token_hash
+    # Signed tokens expire after the time limit, so a cached one must be
+    # replaced well before then
+    return f"{token_hash}-{int(time() // (time_limit / 2))}"
+
+
 @app.route("/changelog", methods=["GET"])
 def view_changelog():
     set_redirect_page()
-    changes = changelog.read_changelog()
-    return _render("changelog.jinja", changes=changes)
+
+    # The page also links to the built assets, and shows the logged in user
+    # and a CSRF token, so a cached page can only be reused by the same user
+    # until any of them change
+    session_user = get_logged_in_user()
+    if session_user is None:
+        user = "anonymous"
+    else:
+        user = f"{session_user['id']}-{session_user['username']}"
+    etag = (
+        f"{changelog.get_content_hash()}-{assets.get_manifest_hash()}-"
+        f"{user}-{_csrf_etag_part()}"
+    )
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        changes_html = changelog.render_changelog(
+            lambda changes: render_template(
+                "changelog_list.jinja", changes=changes
+            )
+        )
+        response = _render("changelog.jinja", changes_html=changes_html)
+    response.set_etag(etag)
+    # Browsers must check with the server before using a cached page, since
+    # the user may have logged in or out since
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -2,4 +2,14 @@
 # Start command for a deployment
 
 # Assumes `build.sh` was already run
-gunicorn --chdir ./src app:app
+# Each open event stream (`/api/stream`) holds a thread while it waits, so use
+# threaded workers with a thread for each of the `STREAM_MAX_CONNECTIONS`
+# streams (500 by default), plus `REQUEST_THREADS` threads for regular
+# requests (50 by default, which is also the most connections that the
+# database pool opens; see `config.py`). Streams don't hold a database
+# connection while they wait.
+THREADS=$((${STREAM_MAX_CONNECTIONS:-500} + ${REQUEST_THREADS:-50}))
+gunicorn --chdir ./src \
+    --worker-class gthread \
+    --threads "${GUNICORN_THREADS:-$THREADS}" \
+    app:app